@@ -0,0 +1,163 @@
+# app/adaptive.py
+from collections import deque
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import os
+import time
+
+from .intersections import IntersectionRegistry, MODE_CODES, YELLOW_DURATION
+
+AI_BASED = MODE_CODES["AI-BASED"]
+
+# ============================================
+# CONFIG
+# ============================================
+
+WINDOW_SECONDS = float(os.environ.get("AI_WINDOW_SECONDS", 300))
+# cửa sổ quá ngắn / quá ít mẫu (vừa bật AI-BASED, restart, mất kết nối lâu):
+# 1 báo cáo 20 xe chia cho 1 giây = 20 xe/giây -> giữ timer cố định
+MIN_SPAN = float(os.environ.get("AI_MIN_SPAN_SECONDS", 60))
+MIN_SAMPLES = int(os.environ.get("AI_MIN_SAMPLES", 3))
+# xe/giây 1 hướng xả được khi đèn xanh (~1800 xe/giờ)
+SATURATION_FLOW = float(os.environ.get("AI_SATURATION_FLOW", 0.5))
+STARTUP_LOST_TIME = 2      # giây mất ở đầu mỗi pha xanh
+MAX_FLOW_RATIO = 0.95      # Y >= 1 -> chu kỳ Webster vô hạn
+MIN_GREEN, MAX_GREEN = 1, 300   # cùng giới hạn với TimerPhase
+
+# ============================================
+# ROLLING WINDOW
+# ============================================
+
+class CountWindow:
+    """Samples of the last WINDOW_SECONDS + running sums (add/evict O(1) amortized)."""
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, Tuple[int, int, int, int]]] = deque()
+        self.sums = [0, 0, 0, 0]   # N, S, E, W
+
+    def add(self, ts: float, counts: Tuple[int, int, int, int]) -> None:
+        # timestamp thiết bị có thể tới trễ (batch, MQTT): giữ deque tăng dần
+        if self.samples and ts < self.samples[-1][0]:
+            ts = self.samples[-1][0]
+        self.samples.append((ts, counts))
+        for j in range(4):
+            self.sums[j] += counts[j]
+
+    def evict(self, now: float) -> None:
+        limit = now - WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < limit:
+            _, counts = self.samples.popleft()
+            for j in range(4):
+                self.sums[j] -= counts[j]
+
+    def rates(self, now: float) -> Optional[List[float]]:
+        """
+        Arrival rate (xe/giây) per direction. None until the window holds at
+        least MIN_SAMPLES samples spanning MIN_SPAN seconds.
+        """
+        self.evict(now)
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        span = min(WINDOW_SECONDS, now - self.samples[0][0])
+        if span < max(1.0, MIN_SPAN):
+            return None
+        return [s / span for s in self.sums]
+
+# ============================================
+# WEBSTER
+# ============================================
+
+def _clamp(v: float) -> int:
+    return int(max(MIN_GREEN, min(MAX_GREEN, round(v))))
+
+def webster_timer_config(rates: List[float]) -> Optional[Dict[str, Dict[str, int]]]:
+    """
+    2 pha (N/S, E/W). Lưu lượng tới hạn = hướng lớn hơn của mỗi pha.
+    C0 = (1.5 L + 5) / (1 - Y), xanh hiệu dụng chia theo y_i.
+    None nếu không có xe nào.
+    """
+    y_ns = max(rates[0], rates[1]) / SATURATION_FLOW
+    y_ew = max(rates[2], rates[3]) / SATURATION_FLOW
+    y_total = y_ns + y_ew
+    if y_total <= 0:
+        return None
+    if y_total > MAX_FLOW_RATIO:
+        y_ns, y_ew = y_ns * MAX_FLOW_RATIO / y_total, y_ew * MAX_FLOW_RATIO / y_total
+        y_total = MAX_FLOW_RATIO
+
+    lost = 2 * (STARTUP_LOST_TIME + YELLOW_DURATION)
+    cycle = (1.5 * lost + 5) / (1 - y_total)
+    effective = cycle - lost
+
+    green_ns = _clamp(effective * y_ns / y_total + STARTUP_LOST_TIME)
+    green_ew = _clamp(effective * y_ew / y_total + STARTUP_LOST_TIME)
+    # đỏ của 1 hướng = xanh + vàng của pha còn lại
+    red_ns = _clamp(green_ew + YELLOW_DURATION)
+    red_ew = _clamp(green_ns + YELLOW_DURATION)
+
+    return {
+        "North": {"red": red_ns, "green": green_ns},
+        "South": {"red": red_ns, "green": green_ns},
+        "East":  {"red": red_ew, "green": green_ew},
+        "West":  {"red": red_ew, "green": green_ew},
+    }
+
+# ============================================
+# ENGINE
+# ============================================
+
+class AdaptiveTimingEngine:
+    """
+    Nhận TrafficCount từ ingest (không query lại DB), tính green split cho
+    nút giao ở chế độ AI-BASED mỗi đầu chu kỳ. Thread-safe.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._windows: Dict[str, CountWindow] = {}
+        self._lock = Lock()
+        self._next_sweep = clock() + WINDOW_SECONDS
+
+    def add_sample(self, intersection_id: str, north: int, south: int, east: int, west: int,
+                   ts: Optional[float] = None) -> None:
+        ts = self.clock() if ts is None else ts
+        with self._lock:
+            window = self._windows.get(intersection_id)
+            if window is None:
+                window = self._windows[intersection_id] = CountWindow()
+            window.add(ts, (north, south, east, west))
+            window.evict(ts)
+            now = self.clock()
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+    def _sweep(self, now: float) -> None:
+        """
+        intersection_id do client gửi: bỏ cửa sổ không có mẫu nào trong
+        WINDOW_SECONDS (rates() của nó đã là None). Caller holds lock.
+        """
+        for key, window in list(self._windows.items()):
+            if not window.samples or window.samples[-1][0] < now - WINDOW_SECONDS:
+                del self._windows[key]
+        self._next_sweep = now + WINDOW_SECONDS
+
+    def rates(self, intersection_id: str, now: Optional[float] = None) -> Optional[List[float]]:
+        now = self.clock() if now is None else now
+        with self._lock:
+            window = self._windows.get(intersection_id)
+            return window.rates(now) if window is not None else None
+
+    def plan(self, intersection_id: str, now: Optional[float] = None) -> Optional[Dict[str, Dict[str, int]]]:
+        """timerConfig cho chu kỳ tới, None nếu chưa đủ dữ liệu (giữ timer cố định)."""
+        rates = self.rates(intersection_id, now)
+        return webster_timer_config(rates) if rates is not None else None
+
+    def retime_cycle_starts(self, registry: IntersectionRegistry, idxs: List[int]) -> None:
+        """AI-BASED: áp plan mới cho các nút vừa bắt đầu chu kỳ (pha 1). Caller holds registry lock."""
+        for idx in idxs:
+            if registry.phase[idx] == 1 and registry.mode[idx] == AI_BASED:
+                plan = self.plan(registry.ids[idx])
+                if plan is not None:
+                    registry.retime(idx, plan)
+
+engine = AdaptiveTimingEngine()
@@ -1,15 +1,28 @@
 # app/ai_ingest.py
-from fastapi import APIRouter, Depends, HTTPException, Header, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from . import schemas, models, database, notify, mqtt_client, auth
+from datetime import datetime, timedelta
+from threading import Condition, Thread
+from typing import Literal, Optional
+import json
+from . import schemas, models, database, notify, mqtt_client, auth, adaptive, traffic, ingest_buffer, count_cache, rollups, retention, alert_rules, recipients, binary_format
 import os
-import requests
 
 from .auth import role_required
+from .utils import device_time, epoch
 router = APIRouter(prefix="/api")
 
-ALERT_THRESHOLD = int(os.environ.get("ALERT_THRESHOLD", 15))  # Ngưỡng cảnh báo     
+MAX_BATCH_SIZE = int(os.environ.get("INGEST_MAX_BATCH", 10000))
+# scale-out: chỉ 1 replica nên nhận traffic count qua MQTT (MQTT_INGEST=0 ở các replica còn lại)
+MQTT_INGEST = os.environ.get("MQTT_INGEST", "1") != "0"
+MAX_HISTORY_LIMIT = 10000
+HISTORY_CHUNK = 500
+DIRECTIONS = ["north", "south", "east", "west"]
 
 def get_db():
     db = database.SessionLocal()
@@ -17,91 +30,384 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# /latest đọc từ cache, cập nhật sau mỗi group commit
+ingest_buffer.buffer.add_listener(count_cache.latest.update)
+# ==========================
+# Alerts (dùng chung cho ingest đơn và batch)
+# ==========================
+def _evaluate_alerts(samples: list[dict]):
+    """
+    Đưa từng mẫu qua alert_rules.engine (trung bình trượt + hysteresis + cooldown):
+    chỉ cảnh báo mới bật mới thành AlertLog. Không đụng DB.
+    """
+    events = []
+    for s in samples:
+        events.extend(alert_rules.engine.evaluate(s.get("intersection_id"), epoch(s["timestamp"]), s))
+    if not events:
+        return [], []
+
+    def where(e):
+        if e.intersection_id == alert_rules.DEFAULT_INTERSECTION:
+            return f"Hướng {e.direction}"
+        return f"Nút {e.intersection_id} hướng {e.direction}"
+
+    now = datetime.utcnow()
+    alerts = [
+        {
+            "camera_id": e.direction,
+            "message": f"{where(e)} vượt ngưỡng {e.threshold:g} (trung bình {e.average:.1f})",
+            "value": e.value,
+            "timestamp": now,
+        }
+        for e in events
+    ]
+    return events, alerts
+
+def _notify_alerts(events, alerts: list[dict], to_emails) -> None:
+    # chỉ xếp hàng: dispatcher gom thành digest, gửi qua kết nối SMTP đang mở
+    for e, a in zip(events, alerts):
+        notify.dispatcher.enqueue_alert(
+            to_emails,
+            "[Traffic Alert] High Traffic Detected",
+            f"{a['timestamp']:%Y-%m-%d %H:%M:%S} UTC - {a['message']} (mẫu {e.value})",
+        )
+
+def _raise_alerts(db: Session, samples: list[dict]) -> list[dict]:
+    """Xét ngưỡng + 1 dòng digest email mỗi cảnh báo. Trả về các hàng AlertLog để ghi cùng group commit."""
+    events, alerts = _evaluate_alerts(samples)
+    if events:
+        # cache, invalidate khi user thay đổi -> không query bảng users mỗi lần
+        _notify_alerts(events, alerts, recipients.alert_recipients.get(db, role="police", notify=True))
+    return alerts
+
+async def _raise_alerts_async(db: AsyncSession, samples: list[dict]) -> list[dict]:
+    events, alerts = _evaluate_alerts(samples)
+    if events:
+        _notify_alerts(events, alerts, await recipients.alert_recipients.get_async(db, role="police", notify=True))
+    return alerts
+
+def _to_rows(items: list[schemas.TrafficCountIn]) -> list[dict]:
+    return [
+        {
+            "timestamp": device_time(it.timestamp),
+            "intersection_id": it.intersection_id or traffic.DEFAULT_INTERSECTION,
+            "north": it.north, "south": it.south, "east": it.east, "west": it.west,
+        }
+        for it in items
+    ]
+
+def _feed_adaptive(rows: list[dict]) -> None:
+    for row in rows:
+        # Cập nhật cửa sổ lưu lượng cho chế độ AI-BASED (không query lại DB)
+        adaptive.engine.add_sample(
+            row["intersection_id"] or traffic.DEFAULT_INTERSECTION,
+            row["north"], row["south"], row["east"], row["west"],
+            ts=epoch(row["timestamp"]),
+        )
+
+def _ingest_rows(db: Session, rows: list[dict]) -> ingest_buffer.IngestTicket:
+    """
+    Đưa các hàng (JSON đã validate hoặc binary_format) vào group-commit buffer
+    (TrafficCount + AlertLog ghi chung 1 transaction), cập nhật engine AI-BASED,
+    xét ngưỡng. Dùng cho MQTT (thread riêng); route HTTP dùng _ingest_rows_async.
+    """
+    _feed_adaptive(rows)
+    # ---------------- CHECK NGƯỠNG ----------------
+    alerts = _raise_alerts(db, rows)
+    return ingest_buffer.buffer.submit(rows, alerts)
+
+async def _ingest_rows_async(db: AsyncSession, rows: list[dict]) -> ingest_buffer.IngestTicket:
+    _feed_adaptive(rows)
+    alerts = await _raise_alerts_async(db, rows)
+    return ingest_buffer.buffer.submit(rows, alerts)
+
+async def _wait_durable(ticket: ingest_buffer.IngestTicket) -> None:
+    """INGEST_DURABILITY=sync: chỉ trả lời khi group commit đã xong."""
+    if ingest_buffer.DURABILITY != "sync":
+        return
+    try:
+        await ticket.wait_async(timeout=30)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Ingest write failed: {e}")
+
 # ==========================
 # POST – Ingest traffic count
 # ==========================
 @router.post("/traffic-count", status_code=201)
-def ingest_traffic(
+async def ingest_traffic(
     data: schemas.TrafficCountIn,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     user: models.User = Depends(role_required(["admin"])),
-    background: BackgroundTasks = None
 ):
-    # Lưu vào DB
-    tc = models.TrafficCount(
-        north=data.north,
-        south=data.south,
-        east=data.east,
-        west=data.west
-    )
-    db.add(tc)
-    db.commit()
+    # Lưu vào DB (group commit, xem ingest_buffer)
+    await _wait_durable(await _ingest_rows_async(db, _to_rows([data])))
 
-    # ---------------- CHECK NGƯỠNG ----------------
-    directions = {
-        "north": data.north,
-        "south": data.south,
-        "east": data.east,
-        "west": data.west,
-    }
+    return {"ok": True}
 
-    exceeded = [d for d, v in directions.items() if v >= ALERT_THRESHOLD]
+# ==========================
+# POST – Ingest batch (JSON array hoặc NDJSON)
+# ==========================
+def _parse_batch(body: bytes, content_type: str) -> list[schemas.TrafficCountIn]:
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE})")
 
-    # ===== Nếu có hướng vượt ngưỡng → gửi mail =====
-    if exceeded:
-        msg = "Hướng vượt ngưỡng: " + ", ".join(
-            [f"{d} ({directions[d]})" for d in exceeded]
-        )
-        for d in exceeded:
-            alert = models.AlertLog(
-               camera_id=d,
-               message=f"Hướng {d} vượt ngưỡng {ALERT_THRESHOLD}",
-               value=directions[d]
-            )
-            db.add(alert)
-        db.commit()
+    out = []
+    for i, item in enumerate(items):
+        try:
+            out.append(schemas.TrafficCountIn.parse_obj(item))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={"index": i, "errors": e.errors()})
+    return out
 
-        recipients = [
-            u.email for u in db.query(models.User)
-            .filter(models.User.notify == True, models.User.role == "police")
-        ]
+def _parse_binary(body: bytes) -> list[dict]:
+    try:
+        if binary_format.record_count(body) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE})")
+        return binary_format.decode_rows(body, traffic.DEFAULT_INTERSECTION)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid binary payload: {e}")
 
-        if recipients:
-            background.add_task(
-                notify.send_mail_sync,
-                recipients,
-                "[Traffic Alert] High Traffic Detected",
-                msg
-            )
+def _decode_batch(body: bytes, content_type: str) -> list[dict]:
+    if binary_format.CONTENT_TYPE in content_type or binary_format.is_binary(body):
+        return _parse_binary(body)
+    return _to_rows(_parse_batch(body, content_type))
+
+@router.post("/traffic-count/batch", status_code=201)
+async def ingest_traffic_batch(
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    user: models.User = Depends(role_required(["admin"])),
+):
+    """
+    Nhiều TrafficCountIn trong 1 request: JSON array, NDJSON
+    (Content-Type: application/x-ndjson) hoặc nhị phân binary_format
+    (Content-Type: application/vnd.traffic-count). `timestamp` = thời điểm trên thiết bị.
+    Ghi bằng 1 executemany trong group commit của ingest_buffer.
+    """
+    body = await request.body()
+    # json.loads + tới MAX_BATCH_SIZE lần parse_obj: chạy trong threadpool, không chặn
+    # event loop (SSE, long-poll, /status)
+    rows = await run_in_threadpool(_decode_batch, body, request.headers.get("content-type", ""))
+    if rows:
+        await _wait_durable(await _ingest_rows_async(db, rows))
+    return {"ok": True, "inserted": len(rows)}
+
+# ==========================
+# MQTT – Ingest từ topic TOPIC_TRAFFIC_COUNT
+# ==========================
+class MqttCountIngest:
+    """
+    Message = 1 TrafficCountIn (JSON object), JSON array, NDJSON hoặc binary_format.
+    Callback của paho chỉ decode + validate rồi xếp hàng; thread riêng gom
+    các message mỗi `flush_interval` giây (hoặc đủ `max_rows`) và đưa cả lô
+    vào _ingest như POST /traffic-count/batch.
+    """
+
+    def __init__(self, flush_interval: float = ingest_buffer.FLUSH_INTERVAL,
+                 max_rows: int = ingest_buffer.FLUSH_ROWS):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._cond = Condition()
+        self._rows: list[dict] = []
+        self._thread: Optional[Thread] = None
+        self._stopping = False
+        self.received = 0
+        self.rejected = 0
+
+    def start(self, topic: str = mqtt_client.TOPIC_TRAFFIC_COUNT) -> None:
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+        mqtt_client.subscribe(topic, self.on_message)
+
+    def on_message(self, payload: bytes) -> None:
+        try:
+            if binary_format.is_binary(payload):
+                rows = binary_format.decode_rows(payload, traffic.DEFAULT_INTERSECTION)
+            else:
+                text = payload.decode("utf-8")
+                try:
+                    data = json.loads(text)
+                    raw = data if isinstance(data, list) else [data]
+                except ValueError:
+                    # NDJSON: 1 object mỗi dòng
+                    raw = [json.loads(line) for line in text.splitlines() if line.strip()]
+                rows = _to_rows([schemas.TrafficCountIn.parse_obj(r) for r in raw])
+        except (ValueError, ValidationError) as e:
+            with self._cond:
+                self.rejected += 1
+            print("MQTT traffic-count rejected:", e)
+            return
+
+        with self._cond:
+            self._rows.extend(rows)
+            self.received += 1
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._rows) >= self.max_rows or self._stopping,
+                    self.flush_interval,
+                )
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self) -> None:
+        with self._cond:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+        db = database.SessionLocal()
+        try:
+            _ingest_rows(db, rows)
+        except Exception as e:
+            print(f"❌ MQTT ingest error ({len(rows)} counts): {e}")
+        finally:
+            db.close()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+mqtt_counts = MqttCountIngest()
 
-    return {"ok": True}
 # ==========================
 # GET latest traffic count
 # ==========================
 @router.get("/traffic-count/latest", response_model=schemas.TrafficCountOut)
-def get_latest(db: Session = Depends(get_db)):
-    row = db.query(models.TrafficCount).order_by(models.TrafficCount.id.desc()).first()
-    if not row:
+async def get_latest(request: Request, intersection_id: Optional[str] = None):
+    """Từ count_cache (không query DB). ETag theo id của hàng -> poll không đổi trả 304."""
+    entry = count_cache.latest.get(intersection_id)
+    if entry is None:
         return {
             "timestamp": datetime.now(),
             "north": 0, "south": 0, "east": 0, "west": 0
         }
-    return row
+    _, etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # ==========================
 # GET history
 # ==========================
+HISTORY_COLUMNS = (
+    models.TrafficCount.id, models.TrafficCount.timestamp, models.TrafficCount.intersection_id,
+    models.TrafficCount.north, models.TrafficCount.south,
+    models.TrafficCount.east, models.TrafficCount.west,
+)
+
+def _history_query(limit: int, from_: Optional[datetime], to: Optional[datetime],
+                   after_id: Optional[int], intersection_id: Optional[str] = None):
+    """
+    - after_id: hàng có id > after_id theo thứ tự id (đọc tiếp, range trên PK)
+    - from/to:  khoảng [from, to) theo thứ tự timestamp (index traffic_count.timestamp)
+    - không có gì: `limit` hàng mới nhất, trả về từ cũ → mới
+    - intersection_id: chỉ 1 nút giao (index intersection_id, timestamp, id)
+    """
+    tc = models.TrafficCount
+    q = select(*HISTORY_COLUMNS)
+    if intersection_id is not None:
+        q = q.where(tc.intersection_id == intersection_id)
+    if from_ is not None:
+        q = q.where(tc.timestamp >= device_time(from_))
+    if to is not None:
+        q = q.where(tc.timestamp < device_time(to))
+
+    if after_id is not None:
+        return q.where(tc.id > after_id).order_by(tc.id).limit(limit)
+    if from_ is not None:
+        return q.order_by(tc.timestamp, tc.id).limit(limit)
+    latest = q.order_by(tc.timestamp.desc(), tc.id.desc()).limit(limit).subquery()
+    return select(latest).order_by(latest.c.timestamp, latest.c.id)
+
+async def _stream_history(stmt):
+    """JSON array, encode từng hàng (không dựng list ORM). Kết nối riêng vì
+    dependency đã đóng trước khi StreamingResponse chạy."""
+    async with database.async_engine.connect() as conn:
+        result = await conn.stream(stmt)
+        yield b"["
+        first = True
+        async for rows in result.partitions(HISTORY_CHUNK):
+            items = [
+                json.dumps({
+                    "id": row.id,
+                    "timestamp": row.timestamp.isoformat(),
+                    "intersection_id": row.intersection_id,
+                    "north": row.north, "south": row.south,
+                    "east": row.east, "west": row.west,
+                })
+                for row in rows
+            ]
+            chunk = ",".join(items)
+            yield (chunk if first else "," + chunk).encode()
+            first = False
+        yield b"]"
+
 @router.get("/traffic-count/history", response_model=list[schemas.TrafficCountOut])
-def get_history(limit: int = 100, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.TrafficCount)
-        .order_by(models.TrafficCount.timestamp.desc())
-        .limit(limit)
-        .all()
-    )
-    return rows[::-1]  # đảo lại từ cũ → mới
+async def get_history(
+    limit: int = 100,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    intersection_id: Optional[str] = None,
+):
+    """
+    Lần đầu gọi với from/to (hoặc không gì), các lần sau gửi after_id = id của
+    hàng cuối đã nhận để chỉ tải hàng mới. intersection_id: lọc theo nút giao.
+    limit bị kẹp vào [1, MAX_HISTORY_LIMIT] (client cũ gửi limit lớn vẫn nhận 200).
+    """
+    limit = max(1, min(limit, MAX_HISTORY_LIMIT))
+    stmt = _history_query(limit, from_, to, after_id, intersection_id)
+    return StreamingResponse(_stream_history(stmt), media_type="application/json")
+
+
+# ==========================
+# GET stats (chỉ đọc bảng rollup)
+# ==========================
+STATS_DEFAULT_SPAN = {"minute": timedelta(hours=1), "hour": timedelta(days=1)}
 
+@router.get("/traffic-count/stats")
+async def get_stats(
+    interval: Literal["minute", "hour"] = "minute",
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    intersection_id: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    user: models.User = Depends(auth.get_current_user),
+):
+    """Chuỗi sum/max mỗi hướng + số mẫu theo phút/giờ trong [from, to)."""
+    to_dt = device_time(to)
+    from_dt = device_time(from_) if from_ is not None else to_dt - STATS_DEFAULT_SPAN[interval]
+    return {
+        "from": from_dt.isoformat(),
+        "to": to_dt.isoformat(),
+        "interval": interval,
+        "series": await rollups.series_async(db, interval, from_dt, to_dt, intersection_id),
+    }
 
 # ==========================
 # DELETE history
@@ -111,8 +417,11 @@ def clear_all(
     db: Session = Depends(get_db),
     user: models.User = Depends(role_required(["admin"]))
 ):
-    deleted = db.query(models.TrafficCount).delete()
-    db.commit()
+    # xoá theo chunk id -> không khoá SQLite suốt cả lần xoá
+    deleted = retention.delete_chunked(models.TrafficCount, pause=0)
+    retention.delete_chunked(models.TrafficCountMinute, pause=0)
+    retention.delete_chunked(models.TrafficCountHour, pause=0)
+    count_cache.latest.clear()
     return {"message": f"Deleted {deleted} rows."}
 
 
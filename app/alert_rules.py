@@ -0,0 +1,174 @@
+# app/alert_rules.py
+"""
+Streaming alert rules cho traffic count.
+
+Mỗi (nút giao, hướng) giữ trung bình trượt trong `window` giây. Cảnh báo khi
+trung bình >= threshold, chỉ tắt khi xuống <= clear (hysteresis), và không
+cảnh báo lại trong `cooldown` giây. Mỗi mẫu O(1) (amortized).
+
+Cấu hình: ALERT_THRESHOLD / ALERT_WINDOW / ALERT_COOLDOWN / ALERT_CLEAR_RATIO
+(mặc định cho mọi hướng) + file ALERT_RULES_FILE ghi đè theo nút giao/hướng:
+
+    {
+      "default": {"threshold": 15, "window": 60},
+      "intersections": {
+        "main": {"*": {"threshold": 20}, "north": {"threshold": 25, "cooldown": 300}}
+      }
+    }
+"""
+from collections import deque
+from dataclasses import dataclass, replace
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import json
+import os
+import time
+
+DEFAULT_INTERSECTION = "main"
+DIRECTIONS = ["north", "south", "east", "west"]
+
+ALERT_THRESHOLD = float(os.environ.get("ALERT_THRESHOLD", 15))
+ALERT_WINDOW = float(os.environ.get("ALERT_WINDOW", 60))          # giây
+ALERT_COOLDOWN = float(os.environ.get("ALERT_COOLDOWN", 600))     # giây
+ALERT_CLEAR_RATIO = float(os.environ.get("ALERT_CLEAR_RATIO", 0.8))
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE", "alert_rules.json")
+# intersection_id do client gửi: series không nhận mẫu lâu hơn max(window, cooldown) bị bỏ
+ALERT_SWEEP_INTERVAL = float(os.environ.get("ALERT_SWEEP_INTERVAL", 300))   # giây
+
+# ============================================
+# RULES
+# ============================================
+
+@dataclass(frozen=True)
+class Rule:
+    threshold: float = ALERT_THRESHOLD
+    window: float = ALERT_WINDOW
+    cooldown: float = ALERT_COOLDOWN
+    clear: Optional[float] = None   # None = threshold * ALERT_CLEAR_RATIO
+
+    @property
+    def clear_level(self) -> float:
+        return self.threshold * ALERT_CLEAR_RATIO if self.clear is None else self.clear
+
+def _override(rule: Rule, cfg: Optional[Dict]) -> Rule:
+    if not cfg:
+        return rule
+    fields = {k: float(v) for k, v in cfg.items() if k in ("threshold", "window", "cooldown", "clear")}
+    return replace(rule, **fields)
+
+@dataclass(frozen=True)
+class AlertEvent:
+    intersection_id: str
+    direction: str
+    average: float
+    value: int          # mẫu làm vượt ngưỡng
+    threshold: float
+    timestamp: float
+
+# ============================================
+# STATE
+# ============================================
+
+class _Series:
+    """Trung bình trượt theo thời gian + trạng thái cảnh báo của 1 hướng."""
+    __slots__ = ("samples", "total", "active", "last_alert", "seen")
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, int]] = deque()
+        self.total = 0
+        self.active = False
+        self.last_alert = float("-inf")
+        self.seen = 0.0     # clock() lúc nhận mẫu cuối (không phải timestamp thiết bị)
+
+    def add(self, ts: float, value: int, window: float) -> float:
+        # timestamp thiết bị có thể tới trễ (batch, MQTT): giữ deque tăng dần để
+        # evict từ bên trái luôn đúng
+        if self.samples and ts < self.samples[-1][0]:
+            ts = self.samples[-1][0]
+        self.samples.append((ts, value))
+        self.total += value
+        limit = ts - window
+        while self.samples[0][0] < limit:
+            _, old = self.samples.popleft()
+            self.total -= old
+        return self.total / len(self.samples)
+
+class AlertRuleEngine:
+    """Thread-safe (ingest HTTP + MQTT gọi song song)."""
+
+    def __init__(self, default: Optional[Rule] = None, intersections: Optional[Dict] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = Lock()
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._next_sweep = clock() + ALERT_SWEEP_INTERVAL
+        self.configure(default or Rule(), intersections or {})
+
+    def configure(self, default: Rule, intersections: Dict) -> None:
+        self.default = default
+        self._intersections = intersections
+        self._rules: Dict[Tuple[str, str], Rule] = {}   # cache đã resolve
+
+    def load(self, path: str = ALERT_RULES_FILE) -> None:
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+            with self._lock:
+                self.configure(_override(Rule(), cfg.get("default")), cfg.get("intersections", {}))
+            print(f"✅ Alert rules loaded from {path}")
+        except Exception as e:
+            print(f"❌ Error loading alert rules: {e}")
+
+    def rule(self, intersection_id: str, direction: str) -> Rule:
+        key = (intersection_id, direction)
+        r = self._rules.get(key)
+        if r is None:
+            cfg = self._intersections.get(intersection_id, {})
+            r = _override(_override(self.default, cfg.get("*")), cfg.get(direction))
+            self._rules[key] = r
+        return r
+
+    def evaluate(self, intersection_id: Optional[str], ts: float, counts: Dict[str, int]) -> List[AlertEvent]:
+        """1 mẫu (north/south/east/west) -> các cảnh báo mới bật (thường là rỗng)."""
+        intersection_id = intersection_id or DEFAULT_INTERSECTION
+        events = []
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            for d in DIRECTIONS:
+                value = counts[d] or 0
+                rule = self.rule(intersection_id, d)
+                key = (intersection_id, d)
+                s = self._series.get(key)
+                if s is None:
+                    s = self._series[key] = _Series()
+                s.seen = now
+                avg = s.add(ts, value, rule.window)
+
+                if s.active:
+                    if avg <= rule.clear_level:
+                        s.active = False
+                elif avg >= rule.threshold:
+                    s.active = True
+                    if ts - s.last_alert >= rule.cooldown:
+                        s.last_alert = ts
+                        events.append(AlertEvent(intersection_id, d, avg, value, rule.threshold, ts))
+        return events
+
+    def _sweep(self, now: float) -> None:
+        """Bỏ series (và rule đã cache) im lặng quá max(window, cooldown). Caller holds lock."""
+        for key, s in list(self._series.items()):
+            rule = self.rule(*key)
+            if now - s.seen > max(rule.window, rule.cooldown):
+                del self._series[key]
+                self._rules.pop(key, None)
+        self._next_sweep = now + ALERT_SWEEP_INTERVAL
+
+    def active(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return [k for k, s in self._series.items() if s.active]
+
+engine = AlertRuleEngine()
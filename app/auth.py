@@ -1,8 +1,9 @@
 # app/auth.py
 from fastapi import APIRouter, Depends, HTTPException, Header, Security
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from . import models, schemas, utils, database, notify
+from . import models, schemas, utils, database, notify, recipients, token_cache
 from jose import jwt, JWTError
 from .utils import create_access_token
 from typing import Optional
@@ -42,6 +43,7 @@ def register(u: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(user)
     db.commit()
     db.refresh(user)
+    recipients.alert_recipients.invalidate()
 
     return user
 # dangki
@@ -75,8 +77,8 @@ def send_verify_email(data: schemas.RegisterSendCodeIn, db: Session = Depends(ge
     db.add(rec)
     db.commit()
 
-    # gửi email
-    notify.send_mail_sync(
+    # gửi email (xếp hàng, dispatcher gửi nền)
+    notify.dispatcher.enqueue(
         [data.email],
         "Verify your Traffic Manager account",
         f"Your verification code is: {code}"
@@ -111,6 +113,7 @@ def confirm_register(data: schemas.RegisterConfirmIn, db: Session = Depends(get_
     db.add(user)
     db.commit()
     db.refresh(user)
+    recipients.alert_recipients.invalidate()
 
     # xóa record verify
     db.delete(rec)
@@ -141,9 +144,15 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 
 
 # helper to get current user from Bearer token
+# async: chạy trên event loop, không chiếm thread của threadpool cho mỗi request có token
 security = HTTPBearer()
-def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     token = credentials.credentials
+    # token đã xác thực gần đây -> 1 lần tra dict (xem token_cache)
+    user = token_cache.tokens.get(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, utils.SECRET_KEY, algorithms=["HS256"])
         email: str = payload.get("sub")
@@ -152,12 +161,21 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Security(securi
             raise HTTPException(status_code=401, detail="Invalid token")
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate token")
-    # check blocklist
-    if db.query(models.TokenBlocklist).filter(models.TokenBlocklist.jti == jti).first():
-        raise HTTPException(status_code=401, detail="Token revoked")
-    user = db.query(models.User).filter(models.User.email == email).first()
+
+    generation = token_cache.tokens.generation
+    # session chỉ mở khi cache miss
+    async with database.AsyncSessionLocal() as db:
+        # check blocklist
+        revoked = await db.scalar(
+            select(models.TokenBlocklist.id).where(models.TokenBlocklist.jti == jti).limit(1)
+        )
+        if revoked is not None:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        user = await db.scalar(select(models.User).where(models.User.email == email).limit(1))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    token_cache.tokens.put(token, jti, user, payload.get("exp"), generation)
+    # user dùng chung giữa các request (detached, chỉ đọc): route muốn sửa user thì nạp lại trong Session của mình
     return user
 
 
@@ -173,18 +191,24 @@ def logout(credentials: HTTPAuthorizationCredentials = Security(security), db: S
     # store to blocklist
     db_blk = models.TokenBlocklist(jti=jti)
     db.add(db_blk); db.commit()
+    token_cache.tokens.invalidate_token(jti)
     return {"ok": True}
 
 
 
 #phan quyen : role(admin/viewer/police)
 def role_required(allowed_roles: list[str]):
-    def wrapper(user: models.User = Depends(get_current_user)):
+    async def wrapper(user: models.User = Depends(get_current_user)):
         if user.role not in allowed_roles:
             raise HTTPException(status_code=403, detail="Insufficient privileges")
         return user
     return wrapper
 
+# thống kê cache xác thực (hit/miss)
+@router.get("/cache-stats")
+async def auth_cache_stats(user: models.User = Depends(role_required(["admin"]))):
+    return token_cache.tokens.stats()
+
 #quen pass
 def generate_password(length: int = 16):
     chars = string.ascii_letters + string.digits + "!@#$%^&*()-_=+"
@@ -204,9 +228,10 @@ def forgot_password(data: schemas.ForgotPasswordIn, db: Session = Depends(get_db
     # Hash và cập nhật luôn
     user.hashed_password = utils.hash_password(new_pass)
     db.commit()
+    token_cache.tokens.invalidate_user(email)
 
     # Gửi email cho user
-    notify.send_mail_sync(
+    notify.dispatcher.enqueue(
         [email],
         "Your new password for Traffic Manager",
         f"Your new password is:\n\n{new_pass}\n\nYou can login immediately with this password. Change it later if you want."
@@ -220,16 +245,20 @@ def change_password(
     user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Kiểm tra mật khẩu cũ
-    if not utils.verify_password(data.old_password, user.hashed_password):
+    # Kiểm tra mật khẩu cũ (hash đọc lại từ DB: user có thể là bản trong token_cache)
+    current_hash = db.query(models.User.hashed_password).filter(models.User.id == user.id).scalar()
+    if not current_hash or not utils.verify_password(data.old_password, current_hash):
         raise HTTPException(status_code=400, detail="Old password incorrect")
 
     # Kiểm tra new_password == retype_password
     if data.new_password != data.retype_password:
         raise HTTPException(status_code=400, detail="Retype password does not match")
 
-    # Cập nhật mật khẩu mới
-    user.hashed_password = utils.hash_password(data.new_password)
+    # Cập nhật mật khẩu mới (user từ get_current_user thuộc session khác)
+    db.query(models.User).filter(models.User.id == user.id).update(
+        {"hashed_password": utils.hash_password(data.new_password)}
+    )
     db.commit()
+    token_cache.tokens.invalidate_user(user.email)
 
     return {"message": "Password changed successfully"}
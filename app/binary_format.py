@@ -0,0 +1,103 @@
+# app/binary_format.py
+"""
+Định dạng nhị phân cố định cho traffic count (thiết bị edge, link yếu).
+Little-endian:
+
+    header   "<4sBBI"  magic b"TCNT", version (1), số tên nút giao N, số bản ghi M
+    N tên    u8 độ dài + UTF-8 (bảng tên; N = 0 -> mọi bản ghi thuộc nút mặc định)
+    M record "<dH4H"   timestamp (epoch giây, float64; 0 = lúc server nhận),
+                       chỉ số nút giao trong bảng tên (0xFFFF = nút mặc định),
+                       north/south/east/west (uint16)
+
+1 record = 18 byte (JSON tương đương ~70-90 byte).
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
+import struct
+
+MAGIC = b"TCNT"
+VERSION = 1
+CONTENT_TYPE = "application/vnd.traffic-count"
+
+HEADER = struct.Struct("<4sBBI")
+RECORD = struct.Struct("<dH4H")
+DEFAULT_INDEX = 0xFFFF   # bản ghi không có intersection_id
+
+# (timestamp epoch | None, intersection_id | None, north, south, east, west)
+Record = Tuple[Optional[float], Optional[str], int, int, int, int]
+
+def is_binary(payload: bytes) -> bool:
+    return payload[:4] == MAGIC
+
+def encode(records: Sequence[Record]) -> bytes:
+    """Đóng gói (dùng cho thiết bị / benchmark)."""
+    names: List[str] = []
+    index = {}
+    for r in records:
+        if r[1] is not None and r[1] not in index:
+            index[r[1]] = len(names)
+            names.append(r[1])
+    if len(names) > 255:
+        raise ValueError("at most 255 intersections per payload")
+
+    parts = [HEADER.pack(MAGIC, VERSION, len(names), len(records))]
+    for name in names:
+        raw = name.encode()
+        parts.append(bytes([len(raw)]) + raw)
+    parts.extend(
+        RECORD.pack(r[0] or 0.0, DEFAULT_INDEX if r[1] is None else index[r[1]], r[2], r[3], r[4], r[5])
+        for r in records
+    )
+    return b"".join(parts)
+
+def record_count(payload: bytes) -> int:
+    """Đọc header (kiểm tra magic/version). ValueError nếu sai."""
+    if len(payload) < HEADER.size:
+        raise ValueError("payload shorter than header")
+    magic, version, _, n_records = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("bad magic")
+    if version != VERSION:
+        raise ValueError(f"unsupported version {version}")
+    return n_records
+
+def decode_rows(payload: bytes, default_intersection: Optional[str] = None) -> List[dict]:
+    """
+    -> các hàng TrafficCount (như ai_ingest tạo từ JSON), không qua pydantic.
+    ValueError nếu payload sai định dạng.
+    """
+    n_records = record_count(payload)
+    n_names = payload[5]
+
+    offset = HEADER.size
+    names = []
+    view = memoryview(payload)
+    for _ in range(n_names):
+        if offset >= len(payload):
+            raise ValueError("truncated intersection table")
+        size = payload[offset]
+        names.append(bytes(view[offset + 1:offset + 1 + size]).decode())
+        offset += 1 + size
+    if len(payload) - offset != n_records * RECORD.size:
+        raise ValueError(f"expected {n_records} records of {RECORD.size} bytes")
+    lookup = dict(enumerate(names))
+    lookup[DEFAULT_INDEX] = default_intersection
+    if not names:
+        lookup[0] = default_intersection   # payload cũ: không có bảng tên, chỉ số 0
+
+    now = datetime.utcnow()
+    utc = timezone.utc
+    rows = []
+    append = rows.append
+    try:
+        for ts, idx, n, s, e, w in RECORD.iter_unpack(view[offset:]):
+            append({
+                "timestamp": datetime.fromtimestamp(ts, utc).replace(tzinfo=None) if ts else now,
+                "intersection_id": lookup[idx],
+                "north": n, "south": s, "east": e, "west": w,
+            })
+    except KeyError:
+        raise ValueError("intersection index out of range")
+    except (OverflowError, OSError):
+        raise ValueError("timestamp out of range")
+    return rows
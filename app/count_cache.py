@@ -0,0 +1,74 @@
+# app/count_cache.py
+import os
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+DEFAULT_INTERSECTION = "main"
+
+# id bị dùng lại sau DELETE / khi DB được tạo lại -> ETag kèm id process + số lần clear()
+BOOT_ID = os.urandom(4).hex()
+
+# (id, ETag, JSON body của TrafficCountOut)
+Entry = Tuple[int, str, bytes]
+
+class LatestCountCache:
+    """
+    TrafficCount mới nhất theo nút giao (+ mới nhất toàn bộ) giữ trong RAM.
+    Cập nhật sau mỗi group commit của ingest_buffer, warm từ DB lúc startup;
+    /api/traffic-count/latest đọc thẳng từ đây, không chạm DB.
+    Đọc không cần lock: mỗi entry là tuple bất biến, gán dict là atomic.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Entry] = {}
+        self._latest: Optional[Entry] = None
+        self._lock = Lock()  # chỉ cho writer
+        self.generation = 0
+
+    def _encode(self, row: dict) -> Entry:
+        body = schemas.TrafficCountOut(**row).json().encode()
+        return row["id"], f'"{BOOT_ID}-{self.generation}-{row["id"]}"', body
+
+    def update(self, rows: List[dict]) -> None:
+        """rows: TrafficCount đã commit (có "id"), theo thứ tự insert."""
+        newest: Dict[str, dict] = {}
+        for row in rows:
+            newest[row.get("intersection_id") or DEFAULT_INTERSECTION] = row
+        with self._lock:
+            for key, row in newest.items():
+                current = self._entries.get(key)
+                if current is None or row["id"] > current[0]:
+                    entry = self._encode(row)
+                    self._entries[key] = entry
+                    if self._latest is None or entry[0] > self._latest[0]:
+                        self._latest = entry
+
+    def warm(self, db: Session) -> None:
+        """Hàng mới nhất của từng nút giao (MAX(id) theo ix_traffic_count_intersection_id)."""
+        tc = models.TrafficCount
+        newest = select(func.max(tc.id)).group_by(tc.intersection_id)
+        rows = db.execute(
+            select(tc.id, tc.intersection_id, tc.timestamp, tc.north, tc.south, tc.east, tc.west)
+            .where(tc.id.in_(newest))
+            .order_by(tc.id)
+        ).mappings().all()
+        # update() giữ id lớn hơn -> an toàn nếu ingest đã flush trước khi warm
+        self.update([dict(r) for r in rows])
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries = {}
+            self._latest = None
+
+    def get(self, intersection_id: Optional[str] = None) -> Optional[Entry]:
+        if intersection_id is None:
+            return self._latest
+        return self._entries.get(intersection_id)
+
+latest = LatestCountCache()
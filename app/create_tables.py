@@ -1,8 +1,7 @@
-from app.database import engine, Base
-import app.models  # quan trọng: phải import models để Base biết bảng mới
+from app.database import init_db
 
-print("Creating tables...")
-Base.metadata.create_all(bind=engine)
+print("Creating tables + migrating schema...")
+init_db()   # create_all + migrations.run, chạy lại cũng an toàn
 print("Done.")
 #------Chạy:-------
-#python create_tables.py
\ No newline at end of file
+#python -m app.create_tables
@@ -1,22 +1,136 @@
 # app/database.py
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./traffic.db")
+if DATABASE_URL.startswith("postgres://"):
+    # Heroku/Render vẫn cấp URL kiểu cũ
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+
+# ---------- pool (mọi dialect trừ SQLite in-memory) ----------
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))   # giây, -1 = tắt
+
+# ---------- SQLite PRAGMA, áp cho mỗi kết nối mới ----------
+SQLITE_PRAGMAS = {
+    # phải đứng trước journal_mode: đổi sang WAL ghi header file, sau đó DB mới không
+    # còn nhận auto_vacuum nữa (DB cũ: xem convert_auto_vacuum)
+    "auto_vacuum": "INCREMENTAL",
+    # WAL: đọc không chặn ghi (ticker, ingest, dashboard chạy song song)
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    # NORMAL + WAL: không mất tính nhất quán, chỉ có thể mất commit cuối nếu mất điện
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),     # âm = KiB (~64 MB)
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),   # ms
+    "temp_store": "MEMORY",
+}
+# DB tạo trước khi bật auto_vacuum cần 1 lần VACUUM đầy đủ (ghi lại cả file, khoá DB)
+# -> chỉ chạy khi bật, trong init_db trước khi có worker nào
+SQLITE_CONVERT_AUTO_VACUUM = os.environ.get("SQLITE_CONVERT_AUTO_VACUUM", "0") == "1"
+
+def _engine_kwargs(url: str) -> dict:
+    u = make_url(url)
+    if u.get_backend_name() != "sqlite":
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if u.database and u.database != ":memory:":
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        if u.get_driver_name() == "aiosqlite":
+            # mặc định của aiosqlite là NullPool: mở file + PRAGMA lại mỗi session
+            kwargs["poolclass"] = AsyncAdaptedQueuePool
+    return kwargs
+
+# driver async tương ứng (route nóng chạy trên event loop, không chiếm threadpool)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def _async_url(url: str) -> str:
+    u = make_url(url)
+    driver = ASYNC_DRIVERS.get(u.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver for {u.get_backend_name()}; set ASYNC_DATABASE_URL")
+    return u.set(drivername=driver).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
 
-DATABASE_URL = "sqlite:///./traffic.db"
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL))
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _sqlite_pragmas)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# expire_on_commit=False: object trả về từ dependency dùng được sau khi session đóng
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
+
+def upsert_insert(dialect: str):
+    """insert() có on_conflict_do_update cho dialect hiện tại (None nếu không hỗ trợ)."""
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
-def init_db():
-    from . import models  # import models để SQLAlchemy biết bảng
-    Base.metadata.create_all(bind=engine)
 
-# Gọi hàm tạo DB ngay khi import
-init_db()
\ No newline at end of file
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def convert_auto_vacuum() -> bool:
+    """SQLite: chuyển DB cũ sang auto_vacuum=INCREMENTAL (1 lần VACUUM). True nếu đã INCREMENTAL."""
+    conn = engine.raw_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return True
+        if not SQLITE_CONVERT_AUTO_VACUUM:
+            print("⚠️ SQLite auto_vacuum is not INCREMENTAL; set SQLITE_CONVERT_AUTO_VACUUM=1 "
+                  "for a one-time VACUUM at startup")
+            return False
+        print("🔄 Converting database to auto_vacuum=INCREMENTAL (one-time VACUUM)")
+        # executescript: commit trước, VACUUM không chạy trong transaction
+        conn.executescript("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+        return True
+    finally:
+        conn.close()
+
+def init_db():
+    from . import models, migrations  # import models để SQLAlchemy biết bảng
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+    # DB cũ: cột/index thêm sau khi bảng đã tạo (create_all bỏ qua bảng đã có)
+    version = migrations.run(engine)
+    print(f"✅ Database schema version {version}")
+    if engine.dialect.name == "sqlite":
+        convert_auto_vacuum()
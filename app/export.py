@@ -0,0 +1,125 @@
+# app/export.py
+from datetime import datetime
+from typing import Iterator, Literal, Optional
+import csv
+import io
+import json
+import zlib
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, select, type_coerce
+
+from . import database, models
+from .auth import role_required
+from .utils import device_time
+
+router = APIRouter(prefix="/api")
+
+EXPORT_CHUNK = 5000   # số hàng mỗi lần fetch từ cursor
+
+EXPORT_TABLES = {
+    "traffic_count": (
+        models.TrafficCount,
+        ("id", "timestamp", "intersection_id", "north", "south", "east", "west"),
+    ),
+    "alert_logs": (
+        models.AlertLog,
+        ("id", "timestamp", "camera_id", "message", "value"),
+    ),
+}
+
+# ============================================
+# ENCODERS
+# ============================================
+
+def _iso(value) -> Optional[str]:
+    # SQLite trả chuỗi "YYYY-MM-DD HH:MM:SS[.ffffff]" (xem _stream), dialect khác trả datetime
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.replace(" ", "T", 1)
+    return value.isoformat()
+
+def _csv_chunks(header, partitions) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    t = header.index("timestamp")
+    for rows in partitions:
+        # timestamp ISO-8601 như NDJSON / history
+        writer.writerows((*row[:t], _iso(row[t]), *row[t + 1:]) for row in rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def _ndjson_chunks(header, partitions) -> Iterator[bytes]:
+    dumps = json.dumps
+    for rows in partitions:
+        lines = []
+        for row in rows:
+            item = dict(zip(header, row))
+            item["timestamp"] = _iso(item["timestamp"])
+            lines.append(dumps(item, ensure_ascii=False))
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = định dạng gzip
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+def _stream(table: str, fmt: str, from_: Optional[datetime], to: Optional[datetime]) -> Iterator[bytes]:
+    """Server-side cursor + yield_per: bộ nhớ cố định bất kể số hàng."""
+    model, header = EXPORT_TABLES[table]
+    # timestamp đọc thô (không parse thành datetime rồi format lại) -> nhanh gấp ~2
+    columns = [
+        type_coerce(getattr(model, c), String).label(c) if c == "timestamp" else getattr(model, c)
+        for c in header
+    ]
+    stmt = select(*columns).order_by(model.timestamp, model.id)
+    if from_ is not None:
+        stmt = stmt.where(model.timestamp >= from_)
+    if to is not None:
+        stmt = stmt.where(model.timestamp < to)
+
+    # Core connection (không qua ORM Session) -> không tốn chi phí dựng row ORM
+    with database.engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_CHUNK).execute(stmt)
+        encode = _csv_chunks if fmt == "csv" else _ndjson_chunks
+        yield from encode(header, result.partitions())
+
+# ============================================
+# ENDPOINT
+# ============================================
+
+@router.get("/export/{table}")
+def export_table(
+    table: Literal["traffic_count", "alert_logs"],
+    format: Literal["csv", "ndjson"] = "csv",
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    gzip: bool = False,
+    user: models.User = Depends(role_required(["admin", "police"])),
+):
+    """Xuất toàn bộ hàng trong [from, to) theo timestamp, stream từng chunk (gzip tuỳ chọn)."""
+    from_dt = device_time(from_) if from_ is not None else None
+    to_dt = device_time(to) if to is not None else None
+
+    body = _stream(table, format, from_dt, to_dt)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{table}.{format}"
+    if gzip:
+        body = _gzip(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
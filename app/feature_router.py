@@ -1,7 +1,7 @@
 # app/feature_router.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from .database import get_db, SessionLocal
+from .database import get_db
 from . import models, schemas, auth
 
 router = APIRouter(prefix="/api/features", tags=["features"])
@@ -15,29 +15,12 @@ DEFAULT_FEATURES = [
     "admin_send_notification",
     "admin_display_lights",
 ]
-def seed_features():
-    db: Session = SessionLocal()
-    try:
-        for fid in DEFAULT_FEATURES:
-            exists = (
-                db.query(models.Feature)
-                .filter(models.Feature.feature_id == fid)
-                .first()
-            )
-            if not exists:
-                db.add(models.Feature(
-                    feature_id=fid,
-                    is_enabled=True
-                ))
-        db.commit()
-        print("✅ Features seeded")
-    finally:
-        db.close()
-        
+# seed lúc startup: xem seed.py
+
 # =========================
 # ADMIN GUARD
 # =========================
-def admin_required(user=Depends(auth.get_current_user)):
+async def admin_required(user=Depends(auth.get_current_user)):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     return user
@@ -0,0 +1,222 @@
+# app/ingest_buffer.py
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, List, Optional
+import asyncio
+import os
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from .database import SessionLocal
+from . import models, rollups
+
+# ============================================
+# CONFIG
+# ============================================
+
+FLUSH_INTERVAL = int(os.environ.get("INGEST_FLUSH_MS", 200)) / 1000
+FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", 500))
+# "async": trả lời ngay, ghi trong lần flush tới (mất tối đa FLUSH_INTERVAL nếu crash)
+# "sync":  trả lời sau khi transaction chứa dữ liệu đã commit
+DURABILITY = os.environ.get("INGEST_DURABILITY", "async").lower()
+# OperationalError (DB bị khoá, mất kết nối...): đưa batch lại đầu hàng đợi, thử lại
+# sau RETRY_BACKOFF * 2^n giây (tối đa RETRY_BACKOFF_MAX); hết lượt mới bỏ batch
+FLUSH_RETRIES = int(os.environ.get("INGEST_FLUSH_RETRIES", 5))
+RETRY_BACKOFF = int(os.environ.get("INGEST_RETRY_BACKOFF_MS", 100)) / 1000
+RETRY_BACKOFF_MAX = 5.0
+
+# ============================================
+# BUFFER
+# ============================================
+
+class IngestTicket:
+    """Completion of one submit(): set once the group commit that holds its rows is done."""
+
+    def __init__(self):
+        self._done = Event()
+        self._lock = Lock()
+        self._waiters: List[asyncio.Future] = []
+        self.error: Optional[Exception] = None
+
+    def _finish(self, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.error = error
+            self._done.set()
+            waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            fut.get_loop().call_soon_threadsafe(_resolve, fut)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        if not self._done.wait(timeout):
+            raise TimeoutError("ingest flush timed out")
+        if self.error is not None:
+            raise self.error
+
+    async def wait_async(self, timeout: Optional[float] = None) -> None:
+        """Như wait() nhưng cho route async: không chặn event loop, không cần thread."""
+        fut = asyncio.get_running_loop().create_future()
+        with self._lock:
+            pending = not self._done.is_set()
+            if pending:
+                self._waiters.append(fut)
+        if pending:
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("ingest flush timed out")
+        if self.error is not None:
+            raise self.error
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+class IngestBuffer:
+    """
+    Group commit cho TrafficCount (+ rollup phút/giờ) + AlertLog: gom dữ liệu
+    của nhiều request, ghi trong 1 transaction mỗi `flush_interval` giây hoặc khi đủ `max_rows`.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_rows: int = FLUSH_ROWS):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._cond = Condition()
+        self._counts: List[dict] = []
+        self._alerts: List[dict] = []
+        self._tickets: List[IngestTicket] = []
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+        self._retries = 0          # số lần thử lại liên tiếp của batch đầu hàng đợi
+        self._retry_at = 0.0       # monotonic: chưa flush lại trước thời điểm này
+        # gọi sau mỗi commit thành công với các hàng TrafficCount (đã có "id")
+        self._listeners: List[Callable[[List[dict]], None]] = []
+
+    def add_listener(self, fn: Callable[[List[dict]], None]) -> None:
+        self._listeners.append(fn)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def submit(self, counts: List[dict], alerts: List[dict] = ()) -> IngestTicket:
+        """Queue rows (dict cột -> giá trị, cùng key trong 1 bảng). Không chặn."""
+        ticket = IngestTicket()
+        with self._cond:
+            self._counts.extend(counts)
+            self._alerts.extend(alerts)
+            self._tickets.append(ticket)
+            stopping = self._stopping
+            self._cond.notify()
+        if stopping:
+            # đang shutdown: ghi thẳng, không chờ thread
+            self.flush()
+        elif self._thread is None or not self._thread.is_alive():
+            self.start()
+        return ticket
+
+    def _pending(self) -> int:
+        return len(self._counts) + len(self._alerts)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending() or self._stopping)
+                if self._stopping:
+                    return
+                deadline = max(time.monotonic() + self.flush_interval, self._retry_at)
+                self._cond.wait_for(
+                    lambda: (self._pending() >= self.max_rows and time.monotonic() >= self._retry_at)
+                    or self._stopping,
+                    max(0.0, deadline - time.monotonic()),
+                )
+            self.flush()
+
+    def flush(self) -> None:
+        """Ghi mọi thứ đang chờ trong 1 transaction."""
+        with self._cond:
+            counts, self._counts = self._counts, []
+            alerts, self._alerts = self._alerts, []
+            tickets, self._tickets = self._tickets, []
+        if not counts and not alerts:
+            for t in tickets:
+                t._finish()
+            return
+
+        error: Optional[Exception] = None
+        db = SessionLocal()
+        try:
+            if counts:
+                # key không phải cột chỉ dành cho listener. Insert Core trên Table: bản ORM
+                # chia batch theo các key có giá trị None rồi ghép RETURNING, O(n^2)
+                table = models.TrafficCount.__table__
+                columns = table.columns
+                stmt = insert(table).returning(
+                    models.TrafficCount.id, sort_by_parameter_order=True
+                )
+                result = db.execute(stmt, [
+                    {k: v for k, v in row.items() if k in columns} for row in counts
+                ])
+                for row, row_id in zip(counts, result.scalars()):
+                    row["id"] = row_id
+                rollups.fold(db, counts)
+            if alerts:
+                db.execute(insert(models.AlertLog), alerts)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            error = e
+        finally:
+            db.close()
+
+        if error is not None and self._requeue(error, counts, alerts, tickets):
+            return
+        self._retries = 0
+        if error is not None:
+            print(f"❌ Ingest flush error ({len(counts)} counts, {len(alerts)} alerts): {error}")
+
+        if error is None and counts:
+            for fn in self._listeners:
+                try:
+                    fn(counts)
+                except Exception as e:
+                    print(f"❌ Ingest listener error: {e}")
+
+        for t in tickets:
+            t._finish(error)
+
+    def _requeue(self, error: Exception, counts: List[dict], alerts: List[dict],
+                 tickets: List[IngestTicket]) -> bool:
+        """Lỗi tạm thời: trả batch về đầu hàng đợi (giữ thứ tự), hẹn lần thử sau."""
+        if not isinstance(error, OperationalError) or self._retries >= FLUSH_RETRIES:
+            return False
+        for row in counts:
+            row.pop("id", None)   # id của INSERT đã rollback
+        delay = min(RETRY_BACKOFF * 2 ** self._retries, RETRY_BACKOFF_MAX)
+        self._retries += 1
+        with self._cond:
+            self._counts[:0] = counts
+            self._alerts[:0] = alerts
+            self._tickets[:0] = tickets
+            self._retry_at = time.monotonic() + delay
+            stopping = self._stopping
+        print(f"🔄 Ingest flush retry {self._retries}/{FLUSH_RETRIES} in {delay:.2f}s: {getattr(error, 'orig', error)}")
+        if stopping:
+            # shutdown: không còn thread flush -> chờ rồi thử lại ngay tại đây
+            time.sleep(delay)
+            self.flush()
+        return True
+
+    def stop(self) -> None:
+        """Dừng thread và flush phần còn lại (gọi khi shutdown)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+buffer = IngestBuffer()
@@ -0,0 +1,245 @@
+# app/intersections.py
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import time
+
+import numpy as np
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+YELLOW_DURATION = 3
+
+DIRECTIONS = ["North", "South", "East", "West"]  # light index 0..3
+MODES = ["AUTO", "MANUAL", "EMERGENCY", "AI-BASED"]
+MODE_CODES = {m: i for i, m in enumerate(MODES)}
+EMERGENCY = MODE_CODES["EMERGENCY"]
+
+LIGHT_STATES = ["red", "yellow", "green"]
+RED, YELLOW, GREEN = 0, 1, 2
+
+# phase -> state of N,S,E,W (row 0 unused)
+# 1: E/W green, 2: E/W yellow, 3: N/S green, 4: N/S yellow
+PHASE_STATES = np.array([
+    [RED, RED, RED, RED],
+    [RED, RED, GREEN, GREEN],
+    [RED, RED, YELLOW, YELLOW],
+    [GREEN, GREEN, RED, RED],
+    [YELLOW, YELLOW, RED, RED],
+], dtype=np.int8)
+
+# red lights still have to wait for the following yellow phase
+PHASE_RED_EXTRA = np.array([
+    [0, 0, 0, 0],
+    [YELLOW_DURATION, YELLOW_DURATION, 0, 0],
+    [0, 0, 0, 0],
+    [0, 0, YELLOW_DURATION, YELLOW_DURATION],
+    [0, 0, 0, 0],
+], dtype=np.int32)
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+class IntersectionRegistry:
+    """
+    State of every intersection stored column-wise in numpy arrays
+    (one row per intersection). Next phase transitions are kept in a heap of
+    deadlines, so a tick only touches intersections whose phase ends, and
+    remainingTime is derived from the deadline when read.
+    Not thread-safe: callers hold their own lock.
+    `clock` is used whenever `now` is not passed (virtual clock in simulations).
+    """
+
+    def __init__(self, capacity: int = 64, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        # (deadline, idx, generation); stale entries are skipped on pop
+        self._heap: List[Tuple[float, int, int]] = []
+        self._alloc(capacity)
+
+    def _alloc(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.mode = np.zeros(capacity, dtype=np.int8)
+        self.phase = np.ones(capacity, dtype=np.int8)
+        self.phase_start = np.zeros(capacity, dtype=np.float64)
+        self.cycle_start = np.zeros(capacity, dtype=np.float64)
+        # timerConfig: [direction, (red, green)]
+        self.timer = np.zeros((capacity, 4, 2), dtype=np.int16)
+        # duration of phase 1..4 (column 0 unused)
+        self.durations = np.zeros((capacity, 5), dtype=np.int32)
+        self.states = np.zeros((capacity, 4), dtype=np.int8)
+        # bumped on every reconfigure, invalidates queued deadlines
+        self.generation = np.zeros(capacity, dtype=np.int64)
+        # bumped on every visible change (reconfigure or phase transition)
+        self.version = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self) -> None:
+        n = len(self.ids)
+        old = {k: getattr(self, k) for k in (
+            "mode", "phase", "phase_start", "cycle_start",
+            "timer", "durations", "states", "generation", "version",
+        )}
+        self._alloc(self.capacity * 2)
+        for k, arr in old.items():
+            getattr(self, k)[:n] = arr[:n]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, intersection_id: str) -> bool:
+        return intersection_id in self._index
+
+    def index_of(self, intersection_id: str) -> Optional[int]:
+        return self._index.get(intersection_id)
+
+    # ---------- config ----------
+
+    def add(self, intersection_id: str, mode: str, timer_config: Dict,
+            now: Optional[float] = None) -> int:
+        if intersection_id in self._index:
+            idx = self._index[intersection_id]
+        else:
+            if len(self.ids) == self.capacity:
+                self._grow()
+            idx = len(self.ids)
+            self.ids.append(intersection_id)
+            self._index[intersection_id] = idx
+        self.configure(idx, mode, timer_config, now)
+        return idx
+
+    def configure(self, idx: int, mode: str, timer_config: Optional[Dict] = None,
+                  now: Optional[float] = None) -> None:
+        """Set mode (+ timerConfig if given) and restart the cycle at phase 1."""
+        if timer_config is not None:
+            self._set_timer(idx, timer_config)
+
+        self.mode[idx] = MODE_CODES[mode]
+        self.generation[idx] += 1
+        self.version[idx] += 1
+        if mode == "EMERGENCY":
+            self.states[idx] = RED
+        else:
+            self.reset_cycle(idx, now)
+
+    def retime(self, idx: int, timer_config: Dict) -> None:
+        """Change timerConfig without restarting the cycle (current phase keeps its start)."""
+        self._set_timer(idx, timer_config)
+        self.generation[idx] += 1
+        self.version[idx] += 1
+        if self.mode[idx] != EMERGENCY:
+            self._schedule(idx)
+
+    def _set_timer(self, idx: int, timer_config: Dict) -> None:
+        for j, d in enumerate(DIRECTIONS):
+            self.timer[idx, j, 0] = int(timer_config[d]["red"])
+            self.timer[idx, j, 1] = int(timer_config[d]["green"])
+        self._update_durations(idx)
+
+    def _update_durations(self, idx: int) -> None:
+        self.durations[idx, 1] = self.timer[idx, 2, 1]  # E/W green
+        self.durations[idx, 2] = YELLOW_DURATION
+        self.durations[idx, 3] = self.timer[idx, 0, 1]  # N/S green
+        self.durations[idx, 4] = YELLOW_DURATION
+
+    def reset_cycle(self, idx: int, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        self.phase[idx] = 1
+        self.phase_start[idx] = now
+        self.cycle_start[idx] = now
+        self.states[idx] = PHASE_STATES[1]
+        self._schedule(idx)
+
+    # ---------- scheduling ----------
+
+    def phase_deadline(self, idx: int) -> float:
+        return float(self.phase_start[idx] + self.durations[idx, self.phase[idx]])
+
+    def _schedule(self, idx: int) -> None:
+        heapq.heappush(self._heap, (self.phase_deadline(idx), idx, int(self.generation[idx])))
+
+    def next_deadline(self) -> Optional[float]:
+        """Earliest pending transition (None if every intersection is in EMERGENCY)."""
+        heap = self._heap
+        while heap and heap[0][2] != self.generation[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def tick(self, now: Optional[float] = None) -> List[int]:
+        """
+        Advance every intersection whose phase deadline has passed
+        (one vectorized pass per round). Returns the indices that changed.
+        """
+        now = self.clock() if now is None else now
+        heap = self._heap
+        changed: Dict[int, None] = {}
+
+        while True:
+            due = []
+            while heap and heap[0][0] <= now:
+                _, idx, gen = heapq.heappop(heap)
+                if gen == self.generation[idx]:
+                    due.append(idx)
+            if not due:
+                break
+
+            idxs = np.array(due)
+            # new phase starts exactly at the old deadline -> no drift
+            start = self.phase_start[idxs] + self.durations[idxs, self.phase[idxs]]
+            phase = self.phase[idxs] % 4 + 1
+            self.phase[idxs] = phase
+            self.phase_start[idxs] = start
+            self.cycle_start[idxs[phase == 1]] = start[phase == 1]
+            self.states[idxs] = PHASE_STATES[phase]
+            self.version[idxs] += 1
+
+            deadlines = start + self.durations[idxs, phase]
+            for idx, deadline in zip(due, deadlines.tolist()):
+                heapq.heappush(heap, (deadline, idx, int(self.generation[idx])))
+                changed[idx] = None
+
+        return list(changed)
+
+    # ---------- read ----------
+
+    def mode_of(self, idx: int) -> str:
+        return MODES[self.mode[idx]]
+
+    def timer_config(self, idx: int) -> Dict[str, Dict[str, int]]:
+        return {
+            d: {"red": int(self.timer[idx, j, 0]), "green": int(self.timer[idx, j, 1])}
+            for j, d in enumerate(DIRECTIONS)
+        }
+
+    def remaining(self, idx: int, now: Optional[float] = None) -> List[int]:
+        """remainingTime of N,S,E,W computed from the phase deadline."""
+        if self.mode[idx] == EMERGENCY:
+            return [0, 0, 0, 0]
+        now = self.clock() if now is None else now
+        left = max(0, int(self.phase_deadline(idx) - now))
+        return [left + int(x) for x in PHASE_RED_EXTRA[self.phase[idx]]]
+
+    def lights(self, idx: int, now: Optional[float] = None) -> List[Dict]:
+        remaining = self.remaining(idx, now)
+        return [
+            {
+                "id": j + 1,
+                "name": d,
+                "state": LIGHT_STATES[self.states[idx, j]],
+                "remainingTime": remaining[j],
+            }
+            for j, d in enumerate(DIRECTIONS)
+        ]
+
+    def config(self, idx: int) -> Dict:
+        return {"mode": self.mode_of(idx), "timerConfig": self.timer_config(idx)}
+
+    def status(self, idx: int, now: Optional[float] = None) -> Dict:
+        return {
+            "mode": self.mode_of(idx),
+            "timerConfig": self.timer_config(idx),
+            "lights": self.lights(idx, now),
+        }
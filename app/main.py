@@ -1,22 +1,67 @@
 # app/main.py
-import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from fastapi.middleware.cors import CORSMiddleware
-import io, requests
+import io
 
 from . import feature_router
-from app.feature_router import seed_features
 
 from . import traffic
-from .database import engine, Base, SessionLocal
-from . import models, schemas, auth, mqtt_client, utils, ai_ingest
+from .database import init_db, SessionLocal, async_engine, get_async_db
+from . import models, schemas, auth, mqtt_client, utils, ai_ingest, ingest_buffer, count_cache, rollups, retention, alert_rules, notify, recipients, export, seed, token_cache
 from .auth import role_required
-Base.metadata.create_all(bind=engine)
-app = FastAPI(title="Traffic Manager (backend)")
+
+# ---------- Lifespan: startup / shutdown ----------
+# import không chạm DB/mạng; mọi thứ chạy ở đây, mỗi lần khởi động (redeploy, scale-out)
+
+def _warm_caches():
+    with SessionLocal() as db:
+        # trước khi nhận ingest: rollup cho dữ liệu cũ (nếu chưa có)
+        rollups.start_backfill(db)
+        count_cache.latest.warm(db)
+
+def _shutdown():
+    traffic.stop_traffic_system()
+    retention.compactor.stop()
+    ai_ingest.mqtt_counts.stop()
+    ingest_buffer.buffer.stop()
+    notify.dispatcher.stop()
+    mqtt_client.stop()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 1. schema trước (các bước sau đọc/ghi bảng)
+    await asyncio.to_thread(init_db)
+    # 2. các bước độc lập: chạy song song (I/O SQLite, file, argon2 nhả GIL)
+    await asyncio.gather(
+        asyncio.to_thread(seed.run),
+        asyncio.to_thread(_warm_caches),
+        asyncio.to_thread(alert_rules.engine.load),
+        asyncio.to_thread(traffic.start_traffic_system),
+    )
+    # 3. worker nền: chỉ start thread
+    ingest_buffer.buffer.start()
+    # retention opt-in (RETENTION_DAYS / MINUTE_ROLLUP_RETENTION_DAYS > 0): mặc định không xoá gì
+    if retention.enabled():
+        retention.compactor.start()
+    notify.dispatcher.start()
+    # MQTT (import paho + kết nối) chạy nền, không chặn server nhận request
+    mqtt_start = asyncio.create_task(asyncio.to_thread(ai_ingest.mqtt_counts.start)) if ai_ingest.MQTT_INGEST else None
+    yield
+    if mqtt_start is not None:
+        await mqtt_start
+    await asyncio.to_thread(_shutdown)
+    # kết nối aiosqlite giữ thread riêng -> phải đóng thì process mới thoát
+    await async_engine.dispose()
+
+app = FastAPI(title="Traffic Manager (backend)", lifespan=lifespan)
 
 # CORS
 origins = [
@@ -40,25 +85,6 @@ app.add_middleware(
 @app.get("/")
 def read_root():
     return {"message": "Traffic Manager API is running!"}
-# ---------- Startup: MQTT + seed admin ----------
-@app.on_event("startup")
-def startup():
-    mqtt_client.start_in_thread()
-    # ← THÊM DÒNG NÀY
-    traffic.start_traffic_system()
-    seed_features()
-    db = SessionLocal()
-    admin_email = os.environ.get("ADMIN_EMAIL")
-    admin_pass = os.environ.get("ADMIN_PASS")
-    if admin_email and admin_pass:
-        if not db.query(models.User).filter(models.User.email == admin_email).first():
-            h = utils.hash_password(admin_pass)
-            user = models.User(email=admin_email, hashed_password=h, role="admin", notify=True)
-            db.add(user)
-            db.commit()
-            print("Seeded admin user:", admin_email)
-    db.close()
-
 # ---------- Dependency ---------- 
 def get_db(): 
     db = SessionLocal()
@@ -74,36 +100,11 @@ app.include_router(auth.router)
 app.include_router(ai_ingest.router)
 app.include_router(feature_router.router)
 app.include_router(traffic.router)
+app.include_router(export.router)
 #-------FEATURE RUNNING-------
 @app.get("/")
 def root():
     return {"message": "Feature Toggle API running!"}
-# ---------- Default lights ----------
-
-def init_default_lights():
-    db = SessionLocal()
-    defaults = ["north", "south", "east", "west"]
-
-    for d in defaults:
-        existing = db.query(models.TrafficLight).filter(
-            models.TrafficLight.intersection_id == d
-        ).first()
-
-        if not existing:
-            row = models.TrafficLight(
-                intersection_id=d,
-                red=30,
-                yellow=3,
-                green=27,
-                updated_at=datetime.utcnow()
-            )
-            db.add(row)
-
-    db.commit()
-    db.close()
-
-# Tạo bản ghi mặc định khi khởi động
-init_default_lights()
 
 # ALERT_THRESHOLD = int(os.environ.get("ALERT_THRESHOLD", 15))  # Ngưỡng cảnh báo
 # # ---------- LIGHT CONTROL ----------
@@ -276,9 +277,10 @@ def set_light(payload: schemas.LightSettingIn, db: Session = Depends(get_db),
 """
 # ---------- Alert logs ----------
 @app.get("/api/alerts", response_model=list[schemas.AlertLogOut])
-def alerts(limit: int = 50, db: Session = Depends(get_db),
-           user: models.User = Depends(role_required(["admin","police"]))):
-    return db.query(models.AlertLog).order_by(models.AlertLog.timestamp.desc()).limit(limit).all()
+async def alerts(limit: int = 50, db: AsyncSession = Depends(get_async_db),
+                 user: models.User = Depends(role_required(["admin","police"]))):
+    rows = await db.scalars(select(models.AlertLog).order_by(models.AlertLog.timestamp.desc()).limit(limit))
+    return rows.all()
 
 # ---------- Admin: manage users ----------
 @app.post("/api/users", response_model=schemas.UserOut)
@@ -308,6 +310,7 @@ def create_user(
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    recipients.alert_recipients.invalidate()
     return new_user
 
 
@@ -341,6 +344,9 @@ def delete_user(
 
     db.delete(user)
     db.commit()
+    recipients.alert_recipients.invalidate()
+    # token của user bị xoá hết hiệu lực ngay (không chờ TTL)
+    token_cache.tokens.invalidate_user(user.email)
 
     return {"message": f"User {user.email} deleted successfully."}
 """
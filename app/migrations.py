@@ -0,0 +1,133 @@
+# app/migrations.py
+"""
+Migration có version, chạy 1 lần lúc startup (database.init_db).
+
+- create_all tạo bảng còn thiếu (DB mới có ngay schema đầy đủ)
+- MIGRATIONS chạy theo thứ tự các version chưa có trong bảng schema_migrations
+- mỗi bước idempotent (cột/index đã có thì bỏ qua) -> dừng giữa chừng thì lần
+  sau chạy lại an toàn, DB tạo bằng create_all mới cũng không lỗi
+- ALTER TABLE ADD COLUMN (nullable, không default) chỉ sửa schema, không ghi lại bảng;
+  index trên PostgreSQL dùng CREATE INDEX CONCURRENTLY (không khoá ghi)
+
+Thêm thay đổi schema: sửa models.py, rồi thêm 1 hàm vào cuối MIGRATIONS.
+"""
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# trạng thái vận hành cần sống qua restart (vd. mốc backfill rollup)
+app_state = Table(
+    "app_state", metadata,
+    Column("key", String, primary_key=True),
+    Column("value", String, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _columns(conn: Connection, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+def add_column(conn: Connection, table: str, name: str, ddl_type: str) -> None:
+    if name not in _columns(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}")
+        print(f"🔄 Added column {table}.{name}")
+
+def create_index(conn: Connection, name: str, table: str, columns: Sequence[str]) -> None:
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.exec_driver_sql(
+        f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    )
+
+def get_state(conn, key: str) -> Optional[str]:
+    """Giá trị app_state[key] (None nếu chưa có). conn: Connection hoặc Session."""
+    return conn.execute(select(app_state.c.value).where(app_state.c.key == key)).scalar()
+
+def set_state(conn, key: str, value) -> None:
+    """Ghi app_state[key] trong transaction của caller (caller commit)."""
+    row = {"key": key, "value": str(value), "updated_at": datetime.utcnow()}
+    conn.execute(delete(app_state).where(app_state.c.key == key))
+    conn.execute(app_state.insert().values(**row))
+
+# ============================================
+# MIGRATIONS (chỉ thêm vào cuối, không sửa bước đã phát hành)
+# ============================================
+
+def _user_names(conn: Connection) -> None:
+    # thay cho script tay create_tables.py khi thêm firstname/lastname
+    add_column(conn, "users", "firstname", "VARCHAR")
+    add_column(conn, "users", "lastname", "VARCHAR")
+
+def _query_indexes(conn: Connection) -> None:
+    create_index(conn, "ix_traffic_count_timestamp", "traffic_count", ["timestamp"])
+    create_index(conn, "ix_alert_logs_timestamp", "alert_logs", ["timestamp"])
+    # RecipientCache: WHERE role = ? AND notify = ?
+    create_index(conn, "ix_users_role_notify", "users", ["role", "notify"])
+    # register/confirm: WHERE email = ? AND code = ?
+    create_index(conn, "ix_email_verify_email_code", "email_verify", ["email", "code"])
+
+def _traffic_count_intersection(conn: Connection) -> None:
+    # NULL = nút mặc định (hàng cũ trước khi có cột)
+    add_column(conn, "traffic_count", "intersection_id", "VARCHAR")
+    # hàng mới nhất mỗi nút giao: MAX(id) GROUP BY intersection_id chỉ đọc index
+    create_index(conn, "ix_traffic_count_intersection_id", "traffic_count", ["intersection_id", "id"])
+
+def _traffic_count_intersection_ts(conn: Connection) -> None:
+    # hàng cũ NULL -> "main": lọc theo nút giao chỉ còn 1 điều kiện bằng, không OR IS NULL
+    while conn.exec_driver_sql(
+        "UPDATE traffic_count SET intersection_id = 'main' WHERE id IN "
+        "(SELECT id FROM traffic_count WHERE intersection_id IS NULL LIMIT 5000)"
+    ).rowcount:
+        pass
+    # history 1 nút giao: WHERE intersection_id = ? ORDER BY timestamp, id đọc thẳng index
+    create_index(conn, "ix_traffic_count_intersection_ts", "traffic_count",
+                 ["intersection_id", "timestamp", "id"])
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "users firstname/lastname", _user_names),
+    (2, "query indexes", _query_indexes),
+    (3, "traffic_count.intersection_id", _traffic_count_intersection),
+    (4, "traffic_count intersection/timestamp index", _traffic_count_intersection_ts),
+]
+
+# ============================================
+# RUNNER
+# ============================================
+
+def _applied(conn: Connection) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def run(engine: Engine) -> int:
+    """Áp các migration chưa chạy, trả về schema version hiện tại."""
+    with engine.begin() as conn:
+        metadata.create_all(bind=conn)
+        applied = _applied(conn)
+
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        # autocommit: CREATE INDEX CONCURRENTLY không chạy được trong transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            step(conn)
+        with engine.begin() as conn:
+            if version not in _applied(conn):   # worker khác có thể vừa ghi
+                conn.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        applied.add(version)
+        print(f"✅ Schema migration {version}: {name}")
+
+    return max(applied, default=0)
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -13,6 +13,9 @@ class User(Base):
     lastname = Column(String)       # <-- thêm
     role = Column(String, default="viewer")  # "admin" or "viewer"
     notify = Column(Boolean, default=True)   # whether this user wants email alerts
+
+    # index do migrations.py tạo cho DB cũ; khai báo ở đây để create_all tạo cho DB mới
+    __table_args__ = (Index("ix_users_role_notify", "role", "notify"),)
    
 class TokenBlocklist(Base):
     __tablename__ = "token_blocklist"
@@ -31,13 +34,46 @@ class TrafficCount(Base):
     __tablename__ = "traffic_count"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # index: history theo khoảng thời gian (SQLite kèm rowid -> đủ cho ORDER BY timestamp, id)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # hàng cũ NULL được migration 4 đổi thành "main"; ingest luôn ghi giá trị
+    intersection_id = Column(String, nullable=True, default="main")
 
     north = Column(Integer, default=0)
     south = Column(Integer, default=0)
     east = Column(Integer, default=0)
     west = Column(Integer, default=0)
 
+    __table_args__ = (
+        Index("ix_traffic_count_intersection_id", "intersection_id", "id"),
+        Index("ix_traffic_count_intersection_ts", "intersection_id", "timestamp", "id"),
+    )
+
+class _TrafficRollupColumns:
+    """Tổng hợp theo bucket: sum/max mỗi hướng + số mẫu (cập nhật cùng transaction ingest)."""
+    id = Column(Integer, primary_key=True)
+    intersection_id = Column(String, nullable=False, default="main")
+    bucket = Column(DateTime, nullable=False)   # đầu phút / đầu giờ (UTC)
+    samples = Column(Integer, nullable=False, default=0)
+
+    north_sum = Column(Integer, nullable=False, default=0)
+    south_sum = Column(Integer, nullable=False, default=0)
+    east_sum = Column(Integer, nullable=False, default=0)
+    west_sum = Column(Integer, nullable=False, default=0)
+
+    north_max = Column(Integer, nullable=False, default=0)
+    south_max = Column(Integer, nullable=False, default=0)
+    east_max = Column(Integer, nullable=False, default=0)
+    west_max = Column(Integer, nullable=False, default=0)
+
+class TrafficCountMinute(_TrafficRollupColumns, Base):
+    __tablename__ = "traffic_count_minute"
+    __table_args__ = (UniqueConstraint("bucket", "intersection_id", name="uq_traffic_count_minute_bucket"),)
+
+class TrafficCountHour(_TrafficRollupColumns, Base):
+    __tablename__ = "traffic_count_hour"
+    __table_args__ = (UniqueConstraint("bucket", "intersection_id", name="uq_traffic_count_hour_bucket"),)
+
 # class LightSetting(Base):
 #     __tablename__ = "light_settings"
 #     id = Column(Integer, primary_key=True, index=True)
@@ -54,7 +90,7 @@ class AlertLog(Base):
     camera_id = Column(String)
     message = Column(String)
     value = Column(Integer)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
 #-----------bo sung --------
 
@@ -69,6 +105,8 @@ class EmailVerify(Base):
     code = Column(String)
     expires_at = Column(DateTime)
 
+    __table_args__ = (Index("ix_email_verify_email_code", "email", "code"),)
+
 
 class ResetToken(Base):
     __tablename__ = "reset_tokens"
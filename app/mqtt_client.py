@@ -1,32 +1,74 @@
 # app/mqtt_client.py
 import threading
-import time
-import paho.mqtt.client as mqtt
 import os
 import json
 
 MQTT_BROKER = os.environ.get("MQTT_BROKER", "localhost")
 MQTT_PORT = int(os.environ.get("MQTT_PORT", 1883))
 TOPIC_LIGHT_CONTROL = os.environ.get("TOPIC_LIGHT_CONTROL", "traffic/light/control")
-# optional: receive topics if needed
-client = mqtt.Client()
+TOPIC_TRAFFIC_COUNT = os.environ.get("TOPIC_TRAFFIC_COUNT", "traffic/count")
+MQTT_SUB_QOS = int(os.environ.get("MQTT_SUB_QOS", 0))
 
-def start_mqtt():
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_start()
-        print("MQTT connected to", MQTT_BROKER)
-    except Exception as e:
-        print("MQTT connect error:", e)
+# tạo ở lần dùng đầu (subscribe/publish): không import paho, không kết nối lúc startup
+_client = None
+_client_lock = threading.Lock()
+
+# topic -> handler(payload: bytes); subscribe lại mỗi lần (re)connect
+_subscriptions = {}
+
+def _on_connect(c, userdata, flags, rc):
+    if rc != 0:
+        print("MQTT connect refused, rc =", rc)
+        return
+    print("MQTT connected to", MQTT_BROKER)
+    for topic in _subscriptions:
+        c.subscribe(topic, MQTT_SUB_QOS)
+        print("MQTT subscribed:", topic)
+
+def get_client():
+    """Client dùng chung. Lần đầu: connect_async + loop_start (thread của paho tự kết nối/reconnect)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import paho.mqtt.client as mqtt
+            c = mqtt.Client()
+            c.on_connect = _on_connect
+            c.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+            c.loop_start()
+            _client = c
+            print("🔄 MQTT connecting to", MQTT_BROKER)
+    return _client
+
+def subscribe(topic: str, handler):
+    """Gọi handler(payload) cho mỗi message của topic (chạy trong thread của paho)."""
+    def on_message(c, userdata, msg):
+        try:
+            handler(msg.payload)
+        except Exception as e:
+            print("MQTT handler error:", e)
+
+    _subscriptions[topic] = handler
+    client = get_client()
+    client.message_callback_add(topic, on_message)
+    if client.is_connected():
+        client.subscribe(topic, MQTT_SUB_QOS)
 
 def start_in_thread():
-    t = threading.Thread(target=start_mqtt, daemon=True)
-    t.start()
+    """Giữ tương thích: kết nối nền ngay (không chặn)."""
+    get_client()
+
+def stop():
+    global _client
+    with _client_lock:
+        c, _client = _client, None
+    if c is not None:
+        c.disconnect()
+        c.loop_stop()
 
 def publish_light(intersection: str, red: int, yellow: int, green: int):
     payload = {"intersection": intersection, "red": red, "yellow": yellow, "green": green}
     try:
-        client.publish(TOPIC_LIGHT_CONTROL, json.dumps(payload))
+        get_client().publish(TOPIC_LIGHT_CONTROL, json.dumps(payload))
         print("Published light control:", payload)
     except Exception as e:
         print("MQTT publish error:", e)
@@ -1,27 +1,188 @@
-
 # app/notify.py
 import os
+import queue
 import smtplib
+import time
 from email.mime.text import MIMEText
-from typing import List
+from threading import Event, Lock, Thread, Timer
+from typing import Dict, List, Optional, Tuple, Union
 from . import utils
 
 SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
 SMTP_USER = os.environ.get("SMTP_USER", "")   # set in env
 SMTP_PASS = os.environ.get("SMTP_PASS", "")   # set in env
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") != "0"
 FROM = SMTP_USER
 
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 2))        # số kết nối SMTP giữ mở
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", 60))  # đóng kết nối rảnh sau N giây
+MAIL_MAX_RETRIES = int(os.environ.get("MAIL_MAX_RETRIES", 5))
+MAIL_RETRY_BASE = float(os.environ.get("MAIL_RETRY_BASE", 1.0))   # backoff 1, 2, 4, ... giây
+MAIL_DIGEST_SECONDS = float(os.environ.get("MAIL_DIGEST_SECONDS", 30))
+
+def _configured() -> bool:
+    return bool(SMTP_USER and SMTP_PASS)
+
+def _message(to_email: str, subject: str, body: str) -> str:
+    msg = MIMEText(body)
+    msg["Subject"] = subject
+    msg["From"] = FROM
+    msg["To"] = to_email
+    return msg.as_string()
+
+def _connect() -> smtplib.SMTP:
+    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+    if SMTP_STARTTLS:
+        s.starttls()
+    s.login(SMTP_USER, SMTP_PASS)
+    return s
+
 def send_mail_sync(to_emails: List[str], subject: str, body: str):
-    if not SMTP_USER or not SMTP_PASS:
+    """Gửi ngay, 1 kết nối riêng (script/CLI). Trong request dùng dispatcher.enqueue()."""
+    if not _configured():
         print("SMTP not configured; skipping send_mail")
         return
     msg = MIMEText(body)
     msg["Subject"] = subject
     msg["From"] = FROM
     msg["To"] = ", ".join(to_emails if isinstance(to_emails, list) else [to_emails])
-    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
-    s.starttls()
-    s.login(SMTP_USER, SMTP_PASS)
+    s = _connect()
     s.sendmail(FROM, to_emails, msg.as_string())
     s.quit()
+
+# ============================================
+# DISPATCHER
+# ============================================
+
+# (người nhận, subject, body)
+Mail = Tuple[str, str, str]
+
+class MailDispatcher:
+    """
+    Hàng đợi mail + SMTP_POOL_SIZE worker, mỗi worker giữ 1 kết nối SMTP
+    (STARTTLS + login 1 lần). Lỗi -> đóng kết nối, thử lại với backoff.
+    - enqueue(): mail giao dịch (mã xác thực, mật khẩu mới), gửi ngay.
+    - enqueue_alert(): gom trong MAIL_DIGEST_SECONDS giây thành 1 digest mỗi
+      người nhận, các dòng trùng nhau chỉ giữ 1.
+    Mỗi mail 1 người nhận; mail trùng đang chờ gửi bị bỏ.
+    """
+
+    def __init__(self, workers: int = SMTP_POOL_SIZE, digest_seconds: float = MAIL_DIGEST_SECONDS,
+                 connect=_connect):
+        self.workers = workers
+        self.digest_seconds = digest_seconds
+        self._connect = connect
+        self._queue: "queue.Queue[Optional[Mail]]" = queue.Queue()
+        self._pending = set()          # mail trong hàng đợi (dedupe)
+        self._digests: Dict[Tuple[str, str], Dict[str, None]] = {}   # (to, subject) -> dòng
+        self._digest_timer: Optional[Timer] = None
+        self._lock = Lock()
+        self._stopping = Event()
+        self._threads: List[Thread] = []
+        self.sent = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._threads:
+                return
+            self._stopping.clear()
+            for _ in range(self.workers):
+                t = Thread(target=self._run, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    # ---------- enqueue (không chặn) ----------
+
+    def enqueue(self, to_emails: Union[str, List[str]], subject: str, body: str) -> None:
+        if not self._threads:
+            self.start()
+        for to in ([to_emails] if isinstance(to_emails, str) else to_emails):
+            mail = (to, subject, body)
+            with self._lock:
+                if mail in self._pending:
+                    continue
+                self._pending.add(mail)
+            self._queue.put(mail)
+
+    def enqueue_alert(self, to_emails: List[str], subject: str, line: str) -> None:
+        with self._lock:
+            for to in to_emails:
+                self._digests.setdefault((to, subject), {})[line] = None
+            if self._digest_timer is None:
+                self._digest_timer = Timer(self.digest_seconds, self.flush_digests)
+                self._digest_timer.daemon = True
+                self._digest_timer.start()
+
+    def flush_digests(self) -> None:
+        with self._lock:
+            digests, self._digests = self._digests, {}
+            if self._digest_timer is not None:
+                self._digest_timer.cancel()
+                self._digest_timer = None
+        for (to, subject), lines in digests.items():
+            self.enqueue(to, subject, "\n".join(lines))
+
+    # ---------- workers ----------
+
+    def _run(self) -> None:
+        conn: Optional[smtplib.SMTP] = None
+        while True:
+            try:
+                mail = self._queue.get(timeout=SMTP_IDLE_TIMEOUT)
+            except queue.Empty:
+                conn = self._close(conn)
+                continue
+            if mail is None:
+                self._close(conn)
+                return
+            with self._lock:
+                self._pending.discard(mail)
+            conn = self._send(conn, mail)
+
+    def _send(self, conn: Optional[smtplib.SMTP], mail: Mail) -> Optional[smtplib.SMTP]:
+        if not _configured():
+            print("SMTP not configured; skipping send_mail")
+            return conn
+        to, subject, body = mail
+        for attempt in range(MAIL_MAX_RETRIES + 1):
+            try:
+                if conn is None:
+                    conn = self._connect()
+                conn.sendmail(FROM, [to], _message(to, subject, body))
+                self.sent += 1
+                return conn
+            except smtplib.SMTPRecipientsRefused as e:
+                print(f"❌ Mail to {to} refused: {e}")
+                break
+            except Exception as e:
+                conn = self._close(conn)
+                if attempt == MAIL_MAX_RETRIES or self._stopping.wait(MAIL_RETRY_BASE * 2 ** attempt):
+                    print(f"❌ Mail to {to} failed after {attempt + 1} attempt(s): {e}")
+                    break
+        self.failed += 1
+        return conn
+
+    @staticmethod
+    def _close(conn: Optional[smtplib.SMTP]) -> None:
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+        return None
+
+    def stop(self, timeout: float = 10) -> None:
+        """Gửi nốt digest + hàng đợi rồi đóng kết nối (gọi khi shutdown)."""
+        self.flush_digests()
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._stopping.set()
+        self._threads = []
+
+dispatcher = MailDispatcher()
@@ -0,0 +1,70 @@
+# app/recipients.py
+import os
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+# replica khác sửa users thì invalidate() ở đây không chạy -> entry tự hết hạn
+RECIPIENTS_CACHE_TTL = float(os.environ.get("RECIPIENTS_CACHE_TTL", 60))   # giây
+
+# (emails, hết hạn monotonic giây)
+Entry = Tuple[Tuple[str, ...], float]
+
+class RecipientCache:
+    """
+    Email theo (role, notify), nạp từ bảng users lần đầu rồi giữ trong RAM.
+    Route tạo/xoá/sửa user gọi invalidate() sau commit; mỗi entry sống tối đa
+    `ttl` giây (thay đổi từ replica khác).
+    `generation` tránh lưu kết quả đọc trước 1 lần invalidate đang chạy song song.
+    """
+
+    def __init__(self, ttl: float = RECIPIENTS_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: Dict[Tuple[str, bool], Entry] = {}
+        self._generation = 0
+
+    @staticmethod
+    def _query(role: str, notify: bool):
+        return select(models.User.email).where(models.User.notify == notify, models.User.role == role)
+
+    def _store(self, key: Tuple[str, bool], generation: int, emails: Tuple[str, ...]) -> Tuple[str, ...]:
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (emails, time.monotonic() + self.ttl)
+        return emails
+
+    def _cached(self, key: Tuple[str, bool]) -> Optional[Tuple[str, ...]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def get(self, db: Session, role: str = "police", notify: bool = True) -> Tuple[str, ...]:
+        key = (role, notify)
+        emails = self._cached(key)
+        if emails is not None:
+            return emails
+        generation = self._generation
+        return self._store(key, generation, tuple(db.scalars(self._query(role, notify))))
+
+    async def get_async(self, db: AsyncSession, role: str = "police", notify: bool = True) -> Tuple[str, ...]:
+        key = (role, notify)
+        emails = self._cached(key)
+        if emails is not None:
+            return emails
+        generation = self._generation
+        return self._store(key, generation, tuple(await db.scalars(self._query(role, notify))))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries = {}
+
+alert_recipients = RecipientCache()
@@ -0,0 +1,151 @@
+# app/retention.py
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from typing import Optional
+import os
+import time
+
+from sqlalchemy import delete, func, select
+
+from .database import SessionLocal, engine
+from . import models, rollups
+
+# ============================================
+# CONFIG
+# ============================================
+
+# hàng traffic_count cũ hơn RETENTION_DAYS ngày bị xoá (đã có trong traffic_count_hour).
+# Opt-in: mặc định 0 = tắt, không xoá dữ liệu nào; bật bằng RETENTION_DAYS=N.
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", 0))
+MINUTE_ROLLUP_RETENTION_DAYS = float(os.environ.get("MINUTE_ROLLUP_RETENTION_DAYS", 0))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", 3600))  # giây giữa 2 lần chạy
+RETENTION_CHUNK = int(os.environ.get("RETENTION_CHUNK", 5000))          # id mỗi transaction
+RETENTION_PAUSE = float(os.environ.get("RETENTION_PAUSE", 0.05))        # nghỉ giữa các chunk
+VACUUM_PAGES = 1000   # trang trả lại cho OS mỗi lần incremental_vacuum
+
+# ============================================
+# CHUNKED DELETE
+# ============================================
+
+def delete_chunked(model, before: Optional[datetime] = None, column=None,
+                   chunk: int = RETENTION_CHUNK, pause: float = RETENTION_PAUSE) -> int:
+    """
+    Xoá các hàng (column < before, hoặc tất cả nếu before=None) theo từng khoảng
+    id [lo, lo + chunk), mỗi khoảng 1 transaction ngắn -> ingest không bị chặn lâu.
+    """
+    if before is not None and column is None:
+        column = model.timestamp
+    db = SessionLocal()
+    try:
+        bounds = select(func.min(model.id), func.max(model.id))
+        if before is not None:
+            bounds = bounds.where(column < before)
+        lo, hi = db.execute(bounds).one()
+        db.commit()
+        if lo is None:
+            return 0
+
+        deleted = 0
+        while lo <= hi:
+            stmt = delete(model).where(model.id >= lo, model.id < lo + chunk)
+            if before is not None:
+                stmt = stmt.where(column < before)
+            deleted += db.execute(stmt).rowcount
+            db.commit()
+            lo += chunk
+            if pause:
+                time.sleep(pause)
+        return deleted
+    finally:
+        db.close()
+
+def incremental_vacuum(pages: int = VACUUM_PAGES) -> int:
+    """SQLite: trả trang trống về OS theo từng đợt nhỏ. Trả về số trang đã giải phóng."""
+    if engine.dialect.name != "sqlite":
+        return 0
+    freed = 0
+    conn = engine.raw_connection()
+    try:
+        # executescript: commit trước, chạy tới hết (sqlite3.execute() chỉ step 1 lần = 1 trang)
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            # DB cũ chưa chuyển đổi (xem database.convert_auto_vacuum): không VACUUM đầy đủ ở đây
+            return 0
+        while True:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            n = min(free, pages)
+            conn.executescript(f"PRAGMA incremental_vacuum({n});")
+            freed += n
+            time.sleep(RETENTION_PAUSE)
+    finally:
+        conn.close()
+    return freed
+
+# ============================================
+# COMPACTOR
+# ============================================
+
+def enabled() -> bool:
+    return RETENTION_DAYS > 0 or MINUTE_ROLLUP_RETENTION_DAYS > 0
+
+class RetentionCompactor:
+    """
+    Background job: mỗi RETENTION_INTERVAL giây xoá raw traffic_count cũ hơn
+    RETENTION_DAYS ngày (đã được fold vào traffic_count_hour lúc ingest),
+    rollup phút cũ hơn MINUTE_ROLLUP_RETENTION_DAYS ngày, rồi incremental vacuum.
+    """
+
+    def __init__(self, interval: float = RETENTION_INTERVAL):
+        self.interval = interval
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if not enabled():
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Retention error: {e}")
+
+    def run_once(self, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        result = {"traffic_count": 0, "traffic_count_minute": 0, "vacuumPages": 0}
+
+        # chỉ xoá raw khi đã bật và marker backfill đã commit (mọi hàng cũ đã nằm trong rollup)
+        if RETENTION_DAYS > 0:
+            with SessionLocal() as db:
+                backfilled = rollups.backfill_complete(db)
+            if backfilled:
+                result["traffic_count"] = delete_chunked(
+                    models.TrafficCount, now - timedelta(days=RETENTION_DAYS)
+                )
+            else:
+                print("⚠️ Retention skipped raw rows: rollup backfill not finished")
+        if MINUTE_ROLLUP_RETENTION_DAYS > 0:
+            result["traffic_count_minute"] = delete_chunked(
+                models.TrafficCountMinute,
+                now - timedelta(days=MINUTE_ROLLUP_RETENTION_DAYS),
+                column=models.TrafficCountMinute.bucket,
+            )
+        result["vacuumPages"] = incremental_vacuum()
+
+        if result["traffic_count"] or result["traffic_count_minute"]:
+            print(f"✅ Retention: {result}")
+        return result
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+compactor = RetentionCompactor()
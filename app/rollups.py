@@ -0,0 +1,231 @@
+# app/rollups.py
+from datetime import datetime
+from threading import Event, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, upsert_insert
+from . import migrations, models
+
+DEFAULT_INTERSECTION = "main"
+DIRECTIONS = ["north", "south", "east", "west"]
+BACKFILL_CHUNK = 5000
+
+# app_state: mốc id được chọn trước khi nhận ingest, và marker ghi cùng transaction với backfill
+BACKFILL_CUTOFF_KEY = "rollup_backfill_cutoff"
+BACKFILL_DONE_KEY = "rollup_backfill_done"
+
+# set khi marker BACKFILL_DONE_KEY có trong DB (retention chỉ xoá raw sau đó)
+backfilled = Event()
+
+# (bucket, intersection_id) -> [samples, sum N,S,E,W, max N,S,E,W]
+Aggregate = Dict[Tuple[datetime, str], List[int]]
+
+def _minute(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+def _hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+LEVELS: Dict[str, Tuple[type, Callable[[datetime], datetime]]] = {
+    "minute": (models.TrafficCountMinute, _minute),
+    "hour": (models.TrafficCountHour, _hour),
+}
+
+# ============================================
+# FOLD
+# ============================================
+
+def aggregate(rows: Iterable[dict], truncate: Callable[[datetime], datetime],
+              into: Optional[Aggregate] = None) -> Aggregate:
+    agg = {} if into is None else into
+    for row in rows:
+        key = (truncate(row["timestamp"]), row.get("intersection_id") or DEFAULT_INTERSECTION)
+        a = agg.get(key)
+        if a is None:
+            a = agg[key] = [0] * 9
+        a[0] += 1
+        for j, d in enumerate(DIRECTIONS):
+            v = row[d] or 0
+            a[1 + j] += v
+            if v > a[5 + j]:
+                a[5 + j] = v
+    return agg
+
+def _agg_rows(agg: Aggregate) -> List[dict]:
+    out = []
+    for (bucket, inter), a in agg.items():
+        row = {"bucket": bucket, "intersection_id": inter, "samples": a[0]}
+        for j, d in enumerate(DIRECTIONS):
+            row[f"{d}_sum"] = a[1 + j]
+            row[f"{d}_max"] = a[5 + j]
+        out.append(row)
+    return out
+
+def _upsert(db: Session, model, agg: Aggregate) -> None:
+    """Cộng dồn vào bucket đã có (sum/samples cộng, max lấy lớn hơn)."""
+    rows = _agg_rows(agg)
+    if not rows:
+        return
+    insert = upsert_insert(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(model)
+        ex = stmt.excluded
+        set_ = {"samples": model.samples + ex.samples}
+        for d in DIRECTIONS:
+            s, m = getattr(model, f"{d}_sum"), getattr(model, f"{d}_max")
+            set_[f"{d}_sum"] = s + ex[f"{d}_sum"]
+            set_[f"{d}_max"] = case((ex[f"{d}_max"] > m, ex[f"{d}_max"]), else_=m)
+        stmt = stmt.on_conflict_do_update(index_elements=[model.bucket, model.intersection_id], set_=set_)
+        db.execute(stmt, rows)
+        return
+
+    for row in rows:
+        existing = db.query(model).filter(
+            model.bucket == row["bucket"], model.intersection_id == row["intersection_id"]
+        ).first()
+        if existing is None:
+            db.add(model(**row))
+            continue
+        existing.samples += row["samples"]
+        for d in DIRECTIONS:
+            setattr(existing, f"{d}_sum", getattr(existing, f"{d}_sum") + row[f"{d}_sum"])
+            setattr(existing, f"{d}_max", max(getattr(existing, f"{d}_max"), row[f"{d}_max"]))
+
+def fold(db: Session, rows: List[dict]) -> None:
+    """Cộng các hàng TrafficCount mới vào rollup phút + giờ (caller commit)."""
+    for model, truncate in LEVELS.values():
+        _upsert(db, model, aggregate(rows, truncate))
+
+# ============================================
+# BACKFILL (DB cũ, chưa có rollup)
+# ============================================
+
+def _mark_done(db: Session, cutoff_id) -> None:
+    migrations.set_state(db, BACKFILL_DONE_KEY, cutoff_id)
+
+def _backfill(cutoff_id: int) -> None:
+    tc = models.TrafficCount
+    aggs = {name: {} for name in LEVELS}
+    db = SessionLocal()
+    try:
+        # đọc theo khoảng id, mỗi khoảng 1 transaction ngắn -> không giữ lock đọc lâu
+        last = 0
+        while True:
+            part = db.execute(
+                select(tc.id, tc.intersection_id, tc.timestamp, tc.north, tc.south, tc.east, tc.west)
+                .where(tc.id > last, tc.id <= cutoff_id)
+                .order_by(tc.id)
+                .limit(BACKFILL_CHUNK)
+            ).mappings().all()
+            db.commit()
+            if not part:
+                break
+            for name, (_, truncate) in LEVELS.items():
+                aggregate(part, truncate, aggs[name])
+            last = part[-1]["id"]
+        for name, (model, _) in LEVELS.items():
+            _upsert(db, model, aggs[name])
+        # cùng transaction với rollup: dừng giữa chừng -> không có marker, lần sau
+        # làm lại với cùng cutoff (hàng > cutoff đã được fold lúc ingest)
+        _mark_done(db, cutoff_id)
+        db.commit()
+        backfilled.set()
+        print(f"✅ Rollups backfilled up to traffic_count.id {cutoff_id}")
+    except Exception as e:
+        db.rollback()
+        print("❌ Rollup backfill error:", e)
+    finally:
+        db.close()
+
+def _legacy_covered(db: Session) -> bool:
+    """DB có rollup từ trước khi có marker: rollup giờ phủ đủ số hàng raw hiện có?"""
+    samples = db.query(func.sum(models.TrafficCountHour.samples)).scalar() or 0
+    raw = db.query(func.count(models.TrafficCount.id)).scalar() or 0
+    return samples >= raw
+
+def start_backfill(db: Session) -> None:
+    """
+    Gọi lúc startup, trước khi nhận ingest: fold các hàng id <= cutoff vào rollup
+    trong thread nền. cutoff = max(id) lúc lần đầu chạy, lưu trong app_state nên
+    restart giữa chừng vẫn dùng lại đúng mốc; hàng mới hơn được ingest_buffer fold
+    nên không bị đếm 2 lần.
+    """
+    if migrations.get_state(db, BACKFILL_DONE_KEY) is not None:
+        backfilled.set()
+        return
+
+    cutoff = migrations.get_state(db, BACKFILL_CUTOFF_KEY)
+    if cutoff is None:
+        if db.query(models.TrafficCountHour.id).first() is not None:
+            # rollup có trước marker: không biết backfill cũ đã xong chưa
+            if _legacy_covered(db):
+                _mark_done(db, "legacy")
+                db.commit()
+                backfilled.set()
+            else:
+                # backfill lại sẽ cộng trùng hàng đã fold -> giữ raw, không tự sửa
+                print("⚠️ Rollups predate the backfill marker and miss raw rows; "
+                      "raw retention stays off")
+            return
+        cutoff = db.query(func.max(models.TrafficCount.id)).scalar()
+        if cutoff is None:
+            _mark_done(db, 0)
+            db.commit()
+            backfilled.set()
+            return
+        migrations.set_state(db, BACKFILL_CUTOFF_KEY, cutoff)
+        db.commit()
+
+    Thread(target=_backfill, args=(int(cutoff),), daemon=True).start()
+
+def backfill_complete(db: Session) -> bool:
+    """Marker backfill trong DB (replica khác có thể vừa backfill xong)."""
+    if not backfilled.is_set() and migrations.get_state(db, BACKFILL_DONE_KEY) is not None:
+        backfilled.set()
+    return backfilled.is_set()
+
+# ============================================
+# READ
+# ============================================
+
+def _series_query(interval: str, from_: datetime, to: datetime, intersection_id: Optional[str]):
+    model, _ = LEVELS[interval]
+    cols = [func.sum(model.samples).label("samples")]
+    for d in DIRECTIONS:
+        cols.append(func.sum(getattr(model, f"{d}_sum")).label(f"{d}_sum"))
+        cols.append(func.max(getattr(model, f"{d}_max")).label(f"{d}_max"))
+    q = (
+        select(model.bucket, *cols)
+        .where(model.bucket >= from_, model.bucket < to)
+        .group_by(model.bucket)
+        .order_by(model.bucket)
+    )
+    if intersection_id is not None:
+        q = q.where(model.intersection_id == intersection_id)
+    return q
+
+def _series_rows(rows) -> List[dict]:
+    return [
+        {
+            "timestamp": r["bucket"].isoformat(),
+            "samples": r["samples"],
+            "sum": {d: r[f"{d}_sum"] for d in DIRECTIONS},
+            "max": {d: r[f"{d}_max"] for d in DIRECTIONS},
+        }
+        for r in rows
+    ]
+
+def series(db: Session, interval: str, from_: datetime, to: datetime,
+           intersection_id: Optional[str] = None) -> List[dict]:
+    """Các bucket trong [from, to), gộp mọi nút giao nếu intersection_id là None."""
+    return _series_rows(db.execute(_series_query(interval, from_, to, intersection_id)).mappings())
+
+async def series_async(db: AsyncSession, interval: str, from_: datetime, to: datetime,
+                       intersection_id: Optional[str] = None) -> List[dict]:
+    """Như series(), cho route async."""
+    result = await db.execute(_series_query(interval, from_, to, intersection_id))
+    return _series_rows(result.mappings())
@@ -39,6 +39,8 @@ class TrafficCountIn(BaseModel):
     south: int
     east: int
     west: int
+    intersection_id: Optional[str] = None   # None = nút giao mặc định
+    timestamp: Optional[datetime] = None    # thời điểm đo trên thiết bị (batch)
 #class TrafficOut(BaseModel):
 #    id: int
 #    camera_id: str
@@ -48,7 +50,9 @@ class TrafficCountIn(BaseModel):
 #    class Config:
 #        orm_mode = True
 class TrafficCountOut(BaseModel):
+    id: Optional[int] = None   # cursor after_id cho /history
     timestamp: datetime
+    intersection_id: Optional[str] = None   # None = nút mặc định (hàng cũ)
     north: int
     south: int
     east: int
@@ -0,0 +1,61 @@
+# app/seed.py
+"""
+Dữ liệu mặc định lúc startup: features, 4 đèn mặc định, admin từ env.
+Idempotent: mỗi bảng 1 câu INSERT ... ON CONFLICT DO NOTHING (executemany),
+tất cả trong 1 transaction -> chạy lại / nhiều replica khởi động cùng lúc đều an toàn.
+"""
+import os
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, upsert_insert
+from .feature_router import DEFAULT_FEATURES
+from . import models, recipients, utils
+
+DEFAULT_LIGHTS = ["north", "south", "east", "west"]
+
+def insert_missing(db: Session, model, key: str, rows: List[dict]) -> None:
+    """Thêm các hàng chưa có (theo cột unique `key`), bỏ qua hàng đã có."""
+    insert = upsert_insert(db.get_bind().dialect.name)
+    if insert is not None:
+        db.execute(insert(model).on_conflict_do_nothing(index_elements=[key]), rows)
+        return
+    column = getattr(model, key)
+    have = set(db.scalars(select(column).where(column.in_([r[key] for r in rows]))))
+    db.add_all(model(**r) for r in rows if r[key] not in have)
+
+def _admin(db: Session) -> bool:
+    admin_email = os.environ.get("ADMIN_EMAIL")
+    admin_pass = os.environ.get("ADMIN_PASS")
+    if not (admin_email and admin_pass):
+        return False
+    # hash argon2 tốn thời gian -> chỉ hash khi admin chưa có
+    if db.scalar(select(models.User.id).where(models.User.email == admin_email)) is not None:
+        return False
+    insert_missing(db, models.User, "email", [{
+        "email": admin_email,
+        "hashed_password": utils.hash_password(admin_pass),
+        "role": "admin",
+        "notify": True,
+    }])
+    print("Seeded admin user:", admin_email)
+    return True
+
+def run() -> None:
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        insert_missing(db, models.Feature, "feature_id", [
+            {"feature_id": fid, "is_enabled": True} for fid in DEFAULT_FEATURES
+        ])
+        insert_missing(db, models.TrafficLight, "intersection_id", [
+            {"intersection_id": d, "red": 30, "yellow": 3, "green": 27, "updated_at": now}
+            for d in DEFAULT_LIGHTS
+        ])
+        admin_created = _admin(db)
+        db.commit()
+    if admin_created:
+        recipients.alert_recipients.invalidate()
+    print("✅ Seed data ready")
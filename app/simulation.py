@@ -0,0 +1,258 @@
+# app/simulation.py
+"""
+Offline simulation of the phase state machine on a virtual clock.
+
+Replays hours of transitions + an arrival stream (synthetic Poisson or
+recorded TrafficCount rows) in seconds and reports per-direction queue,
+delay and throughput.
+
+    python -m app.simulation --hours 24 --mode AI-BASED --rates 0.1,0.1,0.2,0.2
+    python -m app.simulation --recorded --intersection main --mode AUTO
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import math
+import random
+import time
+
+from . import adaptive
+from .intersections import DIRECTIONS, GREEN, IntersectionRegistry
+
+# (offset giây từ lúc bắt đầu, (N, S, E, W) số xe tới)
+Arrival = Tuple[float, Tuple[int, int, int, int]]
+
+# ============================================
+# CLOCK
+# ============================================
+
+class VirtualClock:
+    """Injectable clock: time only moves when advance() is called."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, dt: float) -> float:
+        self.now += dt
+        return self.now
+
+# ============================================
+# ARRIVAL STREAMS
+# ============================================
+
+def _poisson(rng: random.Random, lam: float) -> int:
+    # Knuth, đủ nhanh cho lam nhỏ (xe/bước)
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+def poisson_arrivals(rates: List[float], duration: float, step: float = 1.0,
+                     seed: Optional[int] = None) -> Iterator[Arrival]:
+    """Synthetic arrivals, rates = xe/giây of N, S, E, W."""
+    rng = random.Random(seed)
+    t = 0.0
+    while t < duration:
+        yield t, tuple(_poisson(rng, r * step) for r in rates)
+        t += step
+
+RECORDED_CHUNK = 5000   # hàng mỗi lần fetch khi replay từ DB
+
+def _recorded_query(intersection_id: str):
+    from sqlalchemy import select
+    from . import models
+
+    tc = models.TrafficCount
+    # WHERE intersection_id = ? ORDER BY timestamp, id: đọc theo ix_traffic_count_intersection_ts
+    return (
+        select(tc.timestamp, tc.north, tc.south, tc.east, tc.west)
+        .where(tc.intersection_id == intersection_id)
+        .order_by(tc.timestamp, tc.id)
+    )
+
+def recorded_arrivals(intersection_id: str = "main", limit: Optional[int] = None) -> Iterator[Arrival]:
+    """
+    TrafficCount rows of one intersection, offsets relative to the first row.
+    Streams (server-side cursor + yield_per), memory stays flat on large tables.
+    """
+    from .database import engine
+    from .utils import device_time, epoch
+
+    stmt = _recorded_query(intersection_id)
+    if limit:
+        stmt = stmt.limit(limit)
+    t0 = None
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=RECORDED_CHUNK).execute(stmt)
+        for ts, n, s, e, w in result:
+            t = epoch(device_time(ts))
+            if t0 is None:
+                t0 = t
+            yield t - t0, (n or 0, s or 0, e or 0, w or 0)
+
+def recorded_span(intersection_id: str = "main") -> Optional[float]:
+    """Seconds between the first and last recorded row (MIN/MAX trên index), None if no rows."""
+    from sqlalchemy import func, select
+    from .database import engine
+    from .utils import device_time, epoch
+    from . import models
+
+    tc = models.TrafficCount
+    stmt = select(func.min(tc.timestamp), func.max(tc.timestamp)).where(tc.intersection_id == intersection_id)
+    with engine.connect() as conn:
+        first, last = conn.execute(stmt).one()
+    if first is None:
+        return None
+    return epoch(device_time(last)) - epoch(device_time(first))
+
+# ============================================
+# SIMULATION
+# ============================================
+
+class Simulation:
+    """
+    1 nút giao, hàng đợi mỗi hướng. Mỗi bước `step` giây: xe tới vào hàng đợi,
+    hướng đang xanh xả tối đa saturation_flow * step xe, delay += queue * step.
+    """
+
+    def __init__(self, mode: str = "AUTO", timer_config: Optional[Dict] = None,
+                 step: float = 1.0, saturation_flow: float = adaptive.SATURATION_FLOW,
+                 report_interval: float = 5.0):
+        from .traffic import AUTO_FIXED_TIMER  # lazy: traffic imports the DB layer
+
+        self.clock = VirtualClock()
+        self.registry = IntersectionRegistry(capacity=1, clock=self.clock)
+        self.engine = adaptive.AdaptiveTimingEngine(clock=self.clock)
+        self.mode = mode
+        self.step = step
+        self.saturation_flow = saturation_flow
+        self.report_interval = report_interval
+
+        if mode == "MANUAL" and timer_config is None:
+            raise ValueError("timer_config is required for MANUAL mode")
+        self.registry.add("sim", mode, timer_config or AUTO_FIXED_TIMER)
+
+        self.queue = [0.0] * 4
+        self.max_queue = [0.0] * 4
+        self.arrived = [0] * 4
+        self.departed = [0.0] * 4
+        self.delay = [0.0] * 4    # xe * giây
+        self.transitions = 0
+        self.cycles = 0
+        self._pending = [0, 0, 0, 0]   # chưa báo cho engine (AI-BASED)
+        self._next_report = report_interval
+
+    def run(self, arrivals: Iterable[Arrival], duration: float) -> Dict:
+        wall = time.perf_counter()
+        arrivals = iter(arrivals)
+        nxt = next(arrivals, None)
+        registry, clock, step = self.registry, self.clock, self.step
+
+        while clock.now < duration:
+            now = clock.now
+            changed = registry.tick(now)
+            if changed:
+                self.transitions += 1
+                if registry.phase[0] == 1:
+                    self.cycles += 1
+                self.engine.retime_cycle_starts(registry, changed)
+
+            while nxt is not None and nxt[0] <= now:
+                for j, n in enumerate(nxt[1]):
+                    self.queue[j] += n
+                    self.arrived[j] += n
+                    self._pending[j] += n
+                nxt = next(arrivals, None)
+
+            if now >= self._next_report:
+                self.engine.add_sample("sim", *self._pending, ts=now)
+                self._pending = [0, 0, 0, 0]
+                self._next_report += self.report_interval
+
+            capacity = self.saturation_flow * step
+            for j in range(4):
+                if registry.states[0, j] == GREEN:
+                    out = min(self.queue[j], capacity)
+                    self.queue[j] -= out
+                    self.departed[j] += out
+                self.delay[j] += self.queue[j] * step
+                self.max_queue[j] = max(self.max_queue[j], self.queue[j])
+
+            clock.advance(step)
+
+        return self.report(duration, time.perf_counter() - wall)
+
+    def report(self, duration: float, wall_seconds: float) -> Dict:
+        directions = {}
+        for j, d in enumerate(DIRECTIONS):
+            departed = self.departed[j]
+            directions[d] = {
+                "arrived": self.arrived[j],
+                "throughput": round(departed, 1),
+                "throughputPerHour": round(departed * 3600 / duration, 1) if duration else 0,
+                "queue": round(self.queue[j], 1),
+                "maxQueue": round(self.max_queue[j], 1),
+                "avgQueue": round(self.delay[j] / duration, 2) if duration else 0,
+                "avgDelay": round(self.delay[j] / departed, 2) if departed else None,
+            }
+        return {
+            "mode": self.mode,
+            "simulatedSeconds": duration,
+            "wallSeconds": round(wall_seconds, 3),
+            "transitions": self.transitions,
+            "cycles": self.cycles,
+            "timerConfig": self.registry.timer_config(0),
+            "directions": directions,
+        }
+
+def simulate(mode: str = "AUTO", hours: float = 1.0, rates: Optional[List[float]] = None,
+             arrivals: Optional[Iterable[Arrival]] = None, timer_config: Optional[Dict] = None,
+             step: float = 1.0, seed: Optional[int] = None) -> Dict:
+    """Run one policy for `hours` of virtual time (rates: synthetic Poisson, or `arrivals`)."""
+    duration = hours * 3600
+    if arrivals is None:
+        arrivals = poisson_arrivals(rates or [0.1, 0.1, 0.1, 0.1], duration, step, seed)
+    return Simulation(mode, timer_config, step).run(arrivals, duration)
+
+# ============================================
+# CLI
+# ============================================
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay traffic-light timing offline")
+    parser.add_argument("--mode", default="AUTO", choices=["AUTO", "MANUAL", "AI-BASED"])
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--rates", default="0.1,0.1,0.1,0.1", help="xe/giây N,S,E,W (synthetic)")
+    parser.add_argument("--recorded", action="store_true", help="replay TrafficCount rows from the DB")
+    parser.add_argument("--intersection", default="main", help="intersection_id to replay (--recorded)")
+    parser.add_argument("--timer", help="timerConfig JSON (MANUAL)")
+    parser.add_argument("--step", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    arrivals = None
+    hours = args.hours
+    if args.recorded:
+        span = recorded_span(args.intersection)
+        if span is not None:
+            arrivals = recorded_arrivals(args.intersection)
+            hours = (span + args.step) / 3600
+
+    report = simulate(
+        mode=args.mode,
+        hours=hours,
+        rates=[float(x) for x in args.rates.split(",")],
+        arrivals=arrivals,
+        timer_config=json.loads(args.timer) if args.timer else None,
+        step=args.step,
+        seed=args.seed,
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
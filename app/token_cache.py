@@ -0,0 +1,100 @@
+# app/token_cache.py
+import os
+import time
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple
+
+from . import models
+
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 10000))   # số token tối đa
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 60))      # giây
+
+# (jti, user, hết hạn epoch giây)
+Entry = Tuple[str, models.User, float]
+
+class TokenCache:
+    """
+    Token đã xác thực (chữ ký + blocklist + user) -> User, theo jti.
+    Hit = tra dict: không decode JWT, không query token_blocklist / users.
+    Mỗi entry sống tối đa `ttl` giây và không quá `exp` của JWT; đầy thì bỏ entry cũ nhất.
+    Invalidate theo jti (logout) hoặc email (đổi mật khẩu / role, xoá user);
+    `generation` tránh lưu user đọc trước 1 lần invalidate đang chạy song song.
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: Dict[str, Entry] = {}       # token -> entry (thứ tự thêm vào)
+        self._by_jti: Dict[str, str] = {}          # jti -> token
+        self._by_email: Dict[str, Set[str]] = {}   # email -> {jti}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[models.User]:
+        entry = self._entries.get(token)
+        if entry is not None and entry[2] > time.time():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if entry is not None:
+            with self._lock:
+                self._drop(entry[0])
+        return None
+
+    def put(self, token: str, jti: str, user: models.User, exp: Optional[float], generation: int) -> None:
+        expires = time.time() + self.ttl
+        if exp is not None:
+            expires = min(expires, exp)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._drop(jti)
+            while len(self._entries) >= self.maxsize:
+                self._drop(next(iter(self._entries.values()))[0])
+            self._entries[token] = (jti, user, expires)
+            self._by_jti[jti] = token
+            self._by_email.setdefault(user.email, set()).add(jti)
+
+    def _drop(self, jti: str) -> None:
+        token = self._by_jti.pop(jti, None)
+        if token is None:
+            return
+        _, user, _ = self._entries.pop(token)
+        jtis = self._by_email.get(user.email)
+        if jtis is not None:
+            jtis.discard(jti)
+            if not jtis:
+                del self._by_email[user.email]
+
+    def invalidate_token(self, jti: str) -> None:
+        with self._lock:
+            self.generation += 1
+            self._drop(jti)
+
+    def invalidate_user(self, email: str) -> None:
+        with self._lock:
+            self.generation += 1
+            for jti in list(self._by_email.get(email, ())):
+                self._drop(jti)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries = {}
+            self._by_jti = {}
+            self._by_email = {}
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+tokens = TokenCache()
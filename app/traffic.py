@@ -1,15 +1,21 @@
 # app/traffic.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Dict, Literal, Optional, List
+from typing import Dict, Literal, Optional, List, Set
 from datetime import datetime
 import time
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+import asyncio
 import json
 import os
+import tempfile
 
-from .database import SessionLocal
-from . import models
+from .database import SessionLocal, upsert_insert
+from . import models, adaptive
+from .auth import role_required
+from .intersections import IntersectionRegistry, DIRECTIONS, PHASE_RED_EXTRA, YELLOW_DURATION
 
 router = APIRouter(prefix="/traffic-lights", tags=["Traffic Lights"])
 
@@ -18,7 +24,15 @@ router = APIRouter(prefix="/traffic-lights", tags=["Traffic Lights"])
 # ============================================
 
 CONFIG_FILE = "traffic_config.json"
-YELLOW_DURATION = 3
+DEFAULT_INTERSECTION = "main"
+STREAM_KEEPALIVE = 15     # giây, gửi comment SSE để giữ kết nối
+STREAM_QUEUE_SIZE = 100   # client chậm quá -> ngắt
+LONG_POLL_TIMEOUT = 25    # giây, tối đa giữ request ?since_version=
+PERSIST_DELAY = 0.5       # giây, gom các APPLY liên tiếp thành 1 lần ghi
+
+# version/generation đếm lại từ 0 mỗi lần khởi động -> ETag kèm id của process
+# để If-None-Match từ trước khi restart (hoặc replica khác) không khớp nhầm
+BOOT_ID = os.urandom(4).hex()
 
 # AUTO fixed: xanh 27s, vàng 3s
 AUTO_FIXED_TIMER: Dict[str, Dict[str, int]] = {
@@ -28,13 +42,6 @@ AUTO_FIXED_TIMER: Dict[str, Dict[str, int]] = {
     "West":  {"red": 30, "green": 27},
 }
 
-LIGHTS_DEFAULT = [
-    {"id": 1, "name": "North", "state": "red",   "remainingTime": 30},
-    {"id": 2, "name": "South", "state": "red",   "remainingTime": 30},
-    {"id": 3, "name": "East",  "state": "green", "remainingTime": 27},
-    {"id": 4, "name": "West",  "state": "green", "remainingTime": 27},
-]
-
 ModeLiteral = Literal["AUTO", "MANUAL", "EMERGENCY", "AI-BASED"]
 LightStateLiteral = Literal["red", "yellow", "green"]
 
@@ -71,68 +78,280 @@ class ConfigResponse(BaseModel):
     mode: str
     timerConfig: Dict[str, Dict[str, int]]
 
+class IntersectionSummary(BaseModel):
+    id: str
+    mode: str
+
+class IntersectionCreate(BaseModel):
+    id: str = Field(min_length=1, max_length=64)
+    mode: ModeLiteral = "AUTO"
+    timerConfig: Optional[TimerConfig] = None
+
 # ============================================
 # GLOBAL STATE (RAM)
 # ============================================
 
-traffic_state = {
-    "mode": "AUTO",
-    "timerConfig": AUTO_FIXED_TIMER.copy(),
-    "lights": [l.copy() for l in LIGHTS_DEFAULT],
-    # 1: E/W green, 2: E/W yellow, 3: N/S green, 4: N/S yellow
-    "currentPhase": 1,
-    "phaseStartTime": time.time(),
-    "cycleStartTime": time.time(),
-}
+# Mọi nút giao nằm trong 1 registry (mảng numpy), tick 1 lần cho tất cả
+registry = IntersectionRegistry()
 
 state_lock = Lock()
+# notify() sau mỗi lần đổi cấu hình để scheduler tính lại deadline
+state_changed = Condition(state_lock)
 update_thread: Optional[Thread] = None
 
 # ============================================
-# DB: SAVE FIXED SNAPSHOT (ONLY ON APPLY/LOAD)
+# STREAM: 1 PRODUCER -> N SUBSCRIBERS
 # ============================================
 
-def _save_to_traffic_lights_4ways(snapshot: Dict) -> None:
+class StatusBroadcaster:
     """
-    Lưu snapshot cố định vào bảng traffic_lights:
-    - intersection_id: north/south/east/west
-    - red/yellow/green theo timerConfig
-    - EMERGENCY -> 0/0/0
-    Chỉ gọi khi APPLY hoặc khi load_config startup.
+    Fan-out of traffic events to stream subscribers (one asyncio.Queue each)
+    and long-poll waiters (one asyncio.Event per intersection).
+    publish() may be called from any thread; each event is encoded once.
     """
-    db = SessionLocal()
-    try:
-        mode = snapshot.get("mode", "AUTO")
-        cfg = snapshot.get("timerConfig", AUTO_FIXED_TIMER)
-
-        mapping = {
-            "North": "north",
-            "South": "south",
-            "East": "east",
-            "West": "west",
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.waiters: Dict[str, asyncio.Event] = {}
+
+    def has_subscribers(self, intersection_id: str) -> bool:
+        return bool(self.subscribers.get(intersection_id)) or intersection_id in self.waiters
+
+    def waiter(self, intersection_id: str) -> asyncio.Event:
+        """Call from the event loop. Event is set on the next publish()."""
+        self.loop = asyncio.get_running_loop()
+        event = self.waiters.get(intersection_id)
+        if event is None:
+            event = self.waiters[intersection_id] = asyncio.Event()
+        return event
+
+    def subscribe(self, intersection_id: str) -> asyncio.Queue:
+        """Call from the event loop."""
+        self.loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.subscribers.setdefault(intersection_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, intersection_id: str, queue: asyncio.Queue) -> None:
+        subs = self.subscribers.get(intersection_id)
+        if subs is not None:
+            subs.discard(queue)
+            if not subs:
+                self.subscribers.pop(intersection_id, None)
+
+    def publish(self, intersection_id: str, event: str, data: Dict) -> None:
+        if self.loop is None or not self.has_subscribers(intersection_id):
+            return
+        message = _sse_message(event, data) if self.subscribers.get(intersection_id) else None
+        try:
+            self.loop.call_soon_threadsafe(self._fanout, intersection_id, message)
+        except RuntimeError:
+            pass  # loop closed (shutdown)
+
+    def _fanout(self, intersection_id: str, message: Optional[str]) -> None:
+        waiter = self.waiters.pop(intersection_id, None)
+        if waiter is not None:
+            waiter.set()
+        if message is None:
+            return
+        for queue in list(self.subscribers.get(intersection_id, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # client không đọc kịp -> bỏ hàng đợi, báo generator dừng
+                self.unsubscribe(intersection_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+broadcaster = StatusBroadcaster()
+
+def _sse_message(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ============================================
+# IMMUTABLE SNAPSHOTS (COPY-ON-WRITE)
+# ============================================
+
+class EncodedSnapshot:
+    """
+    Ảnh chụp bất biến của 1 nút giao, build lại chỉ khi version đổi
+    (đổi cấu hình / chuyển pha). JSON được encode sẵn; remainingTime được
+    ghép vào lúc đọc và body giữ lại cho tới khi số giây đổi.
+    """
+
+    def __init__(self, idx: int):
+        self.intersection_id = registry.ids[idx]
+        self.version = int(registry.version[idx])
+        self.generation = int(registry.generation[idx])
+        self.config = registry.config(idx)
+        self.mode = self.config["mode"]
+        self.deadline = None if self.mode == "EMERGENCY" else registry.phase_deadline(idx)
+
+        self.lights = registry.lights(idx)
+        for light in self.lights:
+            del light["remainingTime"]
+        self._red_extra = [int(x) for x in PHASE_RED_EXTRA[registry.phase[idx]]]
+
+        self.config_body = json.dumps(self.config).encode()
+        self.config_etag = f'"c{BOOT_ID}-{self.generation}"'
+
+        # '{"mode": ..., "timerConfig": ..., "lights": [' + prefix của từng đèn
+        self._status_head = json.dumps(self.config)[:-1] + ', "lights": ['
+        self._light_heads = [json.dumps(light)[:-1] + ', "remainingTime": ' for light in self.lights]
+        self._memo = (None, b"")
+
+    def _left(self, now: float) -> int:
+        return 0 if self.deadline is None else max(0, int(self.deadline - now))
+
+    def _remaining(self, left: int) -> List[int]:
+        if self.deadline is None:
+            return [0, 0, 0, 0]
+        return [left + x for x in self._red_extra]
+
+    def status(self, now: float):
+        """-> (body, etag)."""
+        left = self._left(now)
+        memo_left, body = self._memo
+        if memo_left != left:
+            body = (
+                self._status_head
+                + ", ".join(f"{head}{r}}}" for head, r in zip(self._light_heads, self._remaining(left)))
+                + "]}"
+            ).encode()
+            self._memo = (left, body)
+        return body, f'"s{BOOT_ID}-{self.version}-{left}"'
+
+    def payload(self, now: float) -> Dict:
+        """Status + phase deadline (client tự đếm ngược) cho stream."""
+        remaining = self._remaining(self._left(now))
+        return {
+            "intersectionId": self.intersection_id,
+            "mode": self.mode,
+            "timerConfig": self.config["timerConfig"],
+            "lights": [dict(light, remainingTime=r) for light, r in zip(self.lights, remaining)],
+            "phaseEndsAt": self.deadline,
         }
 
-        now = datetime.utcnow()
+# Reader không lấy lock: chỉ đọc reference hiện tại. Writer (giữ state_lock) thay
+# snapshot của key đã có tại chỗ (gán 1 key là atomic, không đổi kích thước dict
+# nên reader đang duyệt không lỗi); chỉ khi thêm nút giao mới mới tạo dict mới rồi gán lại.
+snapshots: Dict[str, EncodedSnapshot] = {}
+
+def _publish_locked(idxs: List[int], event: str) -> None:
+    """Must be called WITH lock held. Swap in new snapshots, then notify subscribers."""
+    global snapshots
+    if not idxs:
+        return
+    fresh = [EncodedSnapshot(idx) for idx in idxs]
+    if any(snap.intersection_id not in snapshots for snap in fresh):
+        updated = dict(snapshots)
+        for snap in fresh:
+            updated[snap.intersection_id] = snap
+        snapshots = updated
+    else:
+        # mỗi tick: không copy cả dict
+        for snap in fresh:
+            snapshots[snap.intersection_id] = snap
+
+    now = time.time()
+    for snap in fresh:
+        if broadcaster.has_subscribers(snap.intersection_id):
+            broadcaster.publish(snap.intersection_id, event, snap.payload(now))
+
+def _get_snapshot(intersection_id: str) -> EncodedSnapshot:
+    """Lock-free. 404 if intersection is unknown."""
+    snap = snapshots.get(intersection_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail=f"Intersection '{intersection_id}' not found")
+    return snap
+
+def _json_response(request: Request, body: bytes, etag: str, version: int) -> Response:
+    headers = {"ETag": etag, "X-Status-Version": str(version), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def _wait_for_version(intersection_id: str, since_version: int) -> None:
+    """Long-poll: chờ tới khi version > since_version (tối đa LONG_POLL_TIMEOUT)."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LONG_POLL_TIMEOUT
+    while True:
+        # đăng ký waiter trước rồi mới đọc version -> không lỡ sự kiện
+        waiter = broadcaster.waiter(intersection_id)
+        if _get_snapshot(intersection_id).version > since_version:
+            return
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            return
+
+# ============================================
+# DB: SAVE FIXED SNAPSHOT (ONLY ON APPLY/LOAD)
+# ============================================
 
-        for k, db_dir in mapping.items():
-            row = db.query(models.TrafficLight).filter_by(intersection_id=db_dir).first()
-            if not row:
-                row = models.TrafficLight(intersection_id=db_dir)
-                db.add(row)
+def _db_light_key(intersection_id: str, direction: str) -> str:
+    """traffic_lights.intersection_id: 'north' cho nút mặc định, 'id/north' cho nút khác."""
+    if intersection_id == DEFAULT_INTERSECTION:
+        return direction.lower()
+    return f"{intersection_id}/{direction.lower()}"
 
-            if mode == "EMERGENCY":
-                row.red = 0
-                row.yellow = 0
-                row.green = 0
+def _save_to_traffic_lights_4ways(configs: Dict[str, Dict]) -> None:
+    """
+    Lưu snapshot cố định vào bảng traffic_lights, 4 hàng cho mỗi nút giao:
+    - intersection_id: north/south/east/west (nút khác: '<id>/north', ...)
+    - red/yellow/green theo timerConfig
+    - EMERGENCY -> 0/0/0
+    1 câu UPSERT (executemany) cho mọi hàng. Chỉ gọi từ PersistenceWorker.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for iid, cfg in configs.items():
+        timer = cfg.get("timerConfig", AUTO_FIXED_TIMER)
+        for d in DIRECTIONS:
+            if cfg.get("mode", "AUTO") == "EMERGENCY":
+                red, yellow, green = 0, 0, 0
             else:
-                row.red = int(cfg[k]["red"])
-                row.yellow = YELLOW_DURATION
-                row.green = int(cfg[k]["green"])
+                red, yellow, green = int(timer[d]["red"]), YELLOW_DURATION, int(timer[d]["green"])
+            rows.append({
+                "intersection_id": _db_light_key(iid, d),
+                "red": red, "yellow": yellow, "green": green,
+                "updated_at": now,
+            })
+    if not rows:
+        return
 
-            row.updated_at = now
+    db = SessionLocal()
+    try:
+        insert = upsert_insert(db.get_bind().dialect.name)
+        if insert is not None:
+            stmt = insert(models.TrafficLight)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.TrafficLight.intersection_id],
+                set_={c: stmt.excluded[c] for c in ("red", "yellow", "green", "updated_at")},
+            )
+            db.execute(stmt, rows)
+        else:
+            existing = {
+                r.intersection_id: r
+                for r in db.query(models.TrafficLight).filter(
+                    models.TrafficLight.intersection_id.in_([row["intersection_id"] for row in rows])
+                )
+            }
+            for row in rows:
+                obj = existing.get(row["intersection_id"])
+                if obj is None:
+                    db.add(models.TrafficLight(**row))
+                else:
+                    for k, v in row.items():
+                        setattr(obj, k, v)
 
         db.commit()
-        print(f"✅ Saved 4-way snapshot to traffic_lights (mode={mode})")
+        print(f"✅ Saved snapshot of {len(configs)} intersection(s) to traffic_lights")
     except Exception as e:
         print(f"❌ DB save traffic_lights error: {e}")
     finally:
@@ -153,277 +372,306 @@ def _normalize_timer_config_dict(cfg: Dict) -> Dict[str, Dict[str, int]]:
         out[d] = {"red": red, "green": green}
     return out
 
-def _snapshot_for_save_locked() -> Dict:
-    """Must be called WITH lock held."""
-    return {
-        "mode": traffic_state["mode"],
-        "timerConfig": traffic_state["timerConfig"],
-    }
+def _snapshot_for_save() -> Dict:
+    """
+    Lock-free (đọc snapshots).
+    mode/timerConfig ở top-level = nút mặc định (tương thích file cũ).
+    """
+    intersections = {iid: snap.config for iid, snap in snapshots.items()}
+    snapshot = dict(intersections.get(DEFAULT_INTERSECTION, {}))
+    snapshot["intersections"] = intersections
+    return snapshot
 
 def _save_config_snapshot_to_file(snapshot: Dict) -> None:
-    """Save config to file WITHOUT acquiring state_lock."""
+    """Save config to file WITHOUT acquiring state_lock (temp file + rename = atomic)."""
+    tmp_path = None
     try:
-        with open(CONFIG_FILE, "w") as f:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(CONFIG_FILE)), prefix=".traffic_config.", suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
             json.dump(snapshot, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CONFIG_FILE)
+        tmp_path = None
         print("✅ Traffic config saved to file")
     except Exception as e:
         print(f"❌ Error saving traffic config: {e}")
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ============================================
+# WRITE-BEHIND PERSISTENCE
+# ============================================
+
+class PersistenceWorker:
+    """
+    Ghi file config + bảng traffic_lights ở background. Các APPLY liên tiếp
+    trong PERSIST_DELAY giây được gom thành 1 lần ghi.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._cond = Condition()
+        self._dirty: Set[str] = set()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, intersection_ids) -> None:
+        with self._cond:
+            self._dirty.update(intersection_ids)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._stopping)
+                if self._stopping:
+                    return
+                # gom thêm các APPLY tới trong cửa sổ delay
+                self._cond.wait_for(lambda: self._stopping, self.delay)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Error in traffic persistence: {e}")
+
+    def flush(self) -> None:
+        with self._cond:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        snapshot = _snapshot_for_save()
+        _save_config_snapshot_to_file(snapshot)
+        _save_to_traffic_lights_4ways(
+            {iid: cfg for iid, cfg in snapshot["intersections"].items() if iid in dirty}
+        )
+
+    def stop(self) -> None:
+        """Dừng worker và ghi nốt thay đổi còn lại (gọi khi shutdown)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+persistence = PersistenceWorker(PERSIST_DELAY)
+
+def _apply_mode_locked(intersection_id: str, mode: str, timer_cfg: Optional[Dict]) -> int:
+    """
+    Must be called WITH lock held. Registers the intersection if needed.
+    Caller publishes the returned index (_publish_locked).
+    - AUTO: fixed timer
+    - AI-BASED: Webster split từ lưu lượng gần đây (chưa có dữ liệu -> fixed timer)
+    - MANUAL: timer_cfg
+    - EMERGENCY: all red, keep timer_cfg (or current one)
+    """
+    if mode == "AUTO":
+        timer_cfg = AUTO_FIXED_TIMER
+    elif mode == "AI-BASED":
+        timer_cfg = adaptive.engine.plan(intersection_id) or AUTO_FIXED_TIMER
+    elif mode not in ("MANUAL", "EMERGENCY"):
+        mode, timer_cfg = "AUTO", AUTO_FIXED_TIMER
+
+    idx = registry.index_of(intersection_id)
+    if idx is None:
+        idx = registry.add(intersection_id, mode, timer_cfg or AUTO_FIXED_TIMER)
+    else:
+        registry.configure(idx, mode, timer_cfg)
+    state_changed.notify()
+    return idx
 
 def load_config():
     """Load persisted config file and apply to runtime state safely."""
     if not os.path.exists(CONFIG_FILE):
         # Không có file -> dùng AUTO mặc định + sync DB 1 lần để có 4 hướng
-        snap = {"mode": "AUTO", "timerConfig": AUTO_FIXED_TIMER.copy()}
-        _save_to_traffic_lights_4ways(snap)
+        with state_lock:
+            _publish_locked([_apply_mode_locked(DEFAULT_INTERSECTION, "AUTO", None)], "mode")
+        persistence.mark_dirty([DEFAULT_INTERSECTION])
         return
 
     try:
         with open(CONFIG_FILE, "r") as f:
             data = json.load(f)
 
-        mode = data.get("mode", "AUTO")
-        timer_cfg = data.get("timerConfig", AUTO_FIXED_TIMER)
+        # file cũ chỉ có mode/timerConfig của 1 nút giao
+        intersections = data.get("intersections") or {DEFAULT_INTERSECTION: data}
 
         with state_lock:
-            if mode == "AUTO":
-                traffic_state["mode"] = "AUTO"
-                traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                _reset_cycle_locked(phase=1)
-
-            elif mode == "MANUAL":
-                traffic_state["mode"] = "MANUAL"
-                traffic_state["timerConfig"] = _normalize_timer_config_dict(timer_cfg)
-                _reset_cycle_locked(phase=1)
-
-            elif mode == "AI-BASED":
-                traffic_state["mode"] = "AI-BASED"
-                traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                _reset_cycle_locked(phase=1)
-
-            elif mode == "EMERGENCY":
-                traffic_state["mode"] = "EMERGENCY"
-                traffic_state["timerConfig"] = _normalize_timer_config_dict(timer_cfg)
-                _set_emergency_locked()
+            idxs = []
+            for iid, cfg in intersections.items():
+                mode = cfg.get("mode", "AUTO")
+                timer_cfg = _normalize_timer_config_dict(cfg.get("timerConfig", AUTO_FIXED_TIMER))
+                idxs.append(_apply_mode_locked(iid, mode, timer_cfg))
 
-            else:
-                traffic_state["mode"] = "AUTO"
-                traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                _reset_cycle_locked(phase=1)
+            if DEFAULT_INTERSECTION not in registry:
+                idxs.append(_apply_mode_locked(DEFAULT_INTERSECTION, "AUTO", None))
 
-            snap = _snapshot_for_save_locked()
+            _publish_locked(idxs, "mode")
+            loaded = list(registry.ids)
 
-        print("✅ Traffic config loaded from file")
+        print(f"✅ Traffic config loaded from file ({len(intersections)} intersection(s))")
 
         # ✅ sync DB 1 lần khi startup
-        _save_to_traffic_lights_4ways(snap)
+        persistence.mark_dirty(loaded)
 
     except Exception as e:
         print(f"❌ Error loading traffic config: {e}")
+        with state_lock:
+            if DEFAULT_INTERSECTION not in registry:
+                _publish_locked([_apply_mode_locked(DEFAULT_INTERSECTION, "AUTO", None)], "mode")
 
 # ============================================
-# CYCLE / PHASE LOGIC (LOCKED)
-# ============================================
-
-def get_phase_duration_locked(phase: int) -> int:
-    cfg = traffic_state["timerConfig"]
-    if phase == 1:
-        return int(cfg["East"]["green"])      # E/W green
-    if phase == 2:
-        return YELLOW_DURATION               # E/W yellow
-    if phase == 3:
-        return int(cfg["North"]["green"])    # N/S green
-    if phase == 4:
-        return YELLOW_DURATION               # N/S yellow
-    return 10
-
-def _set_emergency_locked():
-    """All red, stop countdown."""
-    for light in traffic_state["lights"]:
-        light["state"] = "red"
-        light["remainingTime"] = 0
-
-def _reset_cycle_locked(phase: int = 1):
-    """Reset cycle timing + apply current phase to lights."""
-    now = time.time()
-    traffic_state["currentPhase"] = phase
-    traffic_state["phaseStartTime"] = now
-    traffic_state["cycleStartTime"] = now
-
-    dur = get_phase_duration_locked(phase)
-    _apply_phase_to_lights_locked(phase=phase, remaining=dur)
-
-def _apply_phase_to_lights_locked(phase: int, remaining: int):
-    # indices: 0=N,1=S,2=E,3=W
-    if phase == 1:
-        # E/W GREEN, N/S RED
-        traffic_state["lights"][0]["state"] = "red"
-        traffic_state["lights"][1]["state"] = "red"
-        traffic_state["lights"][2]["state"] = "green"
-        traffic_state["lights"][3]["state"] = "green"
-
-        ns_red = remaining + YELLOW_DURATION
-        traffic_state["lights"][0]["remainingTime"] = ns_red
-        traffic_state["lights"][1]["remainingTime"] = ns_red
-        traffic_state["lights"][2]["remainingTime"] = remaining
-        traffic_state["lights"][3]["remainingTime"] = remaining
-
-    elif phase == 2:
-        # E/W YELLOW, N/S RED
-        traffic_state["lights"][0]["state"] = "red"
-        traffic_state["lights"][1]["state"] = "red"
-        traffic_state["lights"][2]["state"] = "yellow"
-        traffic_state["lights"][3]["state"] = "yellow"
-
-        traffic_state["lights"][0]["remainingTime"] = remaining
-        traffic_state["lights"][1]["remainingTime"] = remaining
-        traffic_state["lights"][2]["remainingTime"] = remaining
-        traffic_state["lights"][3]["remainingTime"] = remaining
-
-    elif phase == 3:
-        # N/S GREEN, E/W RED
-        traffic_state["lights"][0]["state"] = "green"
-        traffic_state["lights"][1]["state"] = "green"
-        traffic_state["lights"][2]["state"] = "red"
-        traffic_state["lights"][3]["state"] = "red"
-
-        traffic_state["lights"][0]["remainingTime"] = remaining
-        traffic_state["lights"][1]["remainingTime"] = remaining
-
-        ew_red = remaining + YELLOW_DURATION
-        traffic_state["lights"][2]["remainingTime"] = ew_red
-        traffic_state["lights"][3]["remainingTime"] = ew_red
-
-    elif phase == 4:
-        # N/S YELLOW, E/W RED
-        traffic_state["lights"][0]["state"] = "yellow"
-        traffic_state["lights"][1]["state"] = "yellow"
-        traffic_state["lights"][2]["state"] = "red"
-        traffic_state["lights"][3]["state"] = "red"
-
-        traffic_state["lights"][0]["remainingTime"] = remaining
-        traffic_state["lights"][1]["remainingTime"] = remaining
-        traffic_state["lights"][2]["remainingTime"] = remaining
-        traffic_state["lights"][3]["remainingTime"] = remaining
-
-def _update_cycle_locked():
-    now = time.time()
-    phase = traffic_state["currentPhase"]
-    phase_start = traffic_state["phaseStartTime"]
-    duration = get_phase_duration_locked(phase)
-
-    elapsed = now - phase_start
-    if elapsed >= duration:
-        phase = (phase % 4) + 1
-        traffic_state["currentPhase"] = phase
-        traffic_state["phaseStartTime"] = now
-        if phase == 1:
-            traffic_state["cycleStartTime"] = now
-
-        duration = get_phase_duration_locked(phase)
-        elapsed = 0
-
-    remaining = max(0, int(duration - elapsed))
-    _apply_phase_to_lights_locked(phase=phase, remaining=remaining)
-
-# ============================================
-# BACKGROUND THREAD (NO DB WRITES HERE)
+# BACKGROUND SCHEDULER (NO DB WRITES HERE)
 # ============================================
 
 def update_traffic_lights():
-    """Background update thread. (NO DB writes here)"""
+    """
+    Background scheduler: ngủ tới deadline chuyển pha gần nhất (hoặc tới khi
+    cấu hình đổi), rồi chuyển pha cho các nút đến hạn. (NO DB writes here)
+    remainingTime không cập nhật ở đây, được tính khi đọc /status.
+    """
     while True:
         try:
-            with state_lock:
-                mode = traffic_state["mode"]
-
-                if mode in ["AUTO", "MANUAL", "AI-BASED"]:
-                    _update_cycle_locked()
-                elif mode == "EMERGENCY":
-                    _set_emergency_locked()
-                else:
-                    traffic_state["mode"] = "AUTO"
-                    traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                    _reset_cycle_locked(phase=1)
-
-            time.sleep(1)
+            with state_changed:
+                changed = registry.tick(time.time())
+                # AI-BASED: tính lại green split ở đầu mỗi chu kỳ
+                adaptive.engine.retime_cycle_starts(registry, changed)
+                _publish_locked(changed, "phase")
+
+                deadline = registry.next_deadline()
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                state_changed.wait(timeout)
         except Exception as e:
             print(f"❌ Error in traffic light update: {e}")
             time.sleep(1)
 
 def start_traffic_system():
-    """Start background thread once."""
+    """Start background threads once."""
     global update_thread
     if update_thread is None or not update_thread.is_alive():
+        persistence.start()
         load_config()
         update_thread = Thread(target=update_traffic_lights, daemon=True)
         update_thread.start()
         print("✅ Traffic light system started")
 
+def stop_traffic_system():
+    """Flush pending config writes (shutdown)."""
+    persistence.stop()
+
 # ============================================
 # API ENDPOINTS
 # ============================================
+# Các handler đọc không lấy state_lock (chỉ đọc snapshots); phần ghi của
+# /control chạy trong threadpool để event loop không bao giờ chờ lock.
+
+@router.get("/intersections", response_model=List[IntersectionSummary])
+async def list_intersections():
+    """All registered intersections (RAM)."""
+    return [{"id": snap.intersection_id, "mode": snap.mode} for snap in snapshots.values()]
 
 @router.get("/status", response_model=TrafficStatusResponse)
-async def get_status():
-    """Realtime status (RAM)."""
-    with state_lock:
-        return {
-            "mode": traffic_state["mode"],
-            "timerConfig": traffic_state["timerConfig"],
-            "lights": traffic_state["lights"],
-        }
+async def get_status(
+    request: Request,
+    intersection_id: str = DEFAULT_INTERSECTION,
+    since_version: Optional[int] = None,
+):
+    """
+    Realtime status (RAM), pre-encoded JSON + ETag (If-None-Match -> 304).
+    ?since_version=N: giữ request tới khi có version mới hơn N (header X-Status-Version).
+    """
+    if since_version is not None:
+        await _wait_for_version(intersection_id, since_version)
+    snap = _get_snapshot(intersection_id)
+    body, etag = snap.status(time.time())
+    return _json_response(request, body, etag, snap.version)
+
+@router.get("/stream")
+async def stream_status(intersection_id: str = DEFAULT_INTERSECTION):
+    """
+    Server-Sent Events: 'snapshot' khi kết nối, sau đó chỉ gửi 'phase'
+    (chuyển pha) và 'mode' (đổi cấu hình). Payload = status + phaseEndsAt.
+    """
+    _get_snapshot(intersection_id)
+    # subscribe trước rồi mới chụp snapshot -> không mất sự kiện ở giữa
+    queue = broadcaster.subscribe(intersection_id)
+    snapshot = _get_snapshot(intersection_id).payload(time.time())
+
+    async def events():
+        try:
+            yield _sse_message("snapshot", snapshot)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            broadcaster.unsubscribe(intersection_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/config", response_model=ConfigResponse)
-async def get_config():
-    """Current config (RAM)."""
+async def get_config(request: Request, intersection_id: str = DEFAULT_INTERSECTION):
+    """Current config (RAM), pre-encoded JSON + ETag."""
+    snap = _get_snapshot(intersection_id)
+    return _json_response(request, snap.config_body, snap.config_etag, snap.version)
+
+def _timer_cfg(mode: str, timer_config: Optional[TimerConfig]) -> Optional[Dict]:
+    if mode == "MANUAL" and timer_config is None:
+        raise HTTPException(status_code=400, detail="timerConfig is required for MANUAL mode")
+    # EMERGENCY giữ timerConfig hiện tại, AUTO/AI-BASED dùng timer cố định
+    return timer_config.dict() if mode == "MANUAL" else None
+
+def _apply_control(intersection_id: str, mode: str, timer_cfg: Optional[Dict], create: bool = False) -> None:
+    """
+    Locked part of /control (create=False: nút giao phải có sẵn) and of
+    POST /intersections (create=True: chưa được có), run in the threadpool.
+    File/DB are written behind.
+    """
     with state_lock:
-        return {
-            "mode": traffic_state["mode"],
-            "timerConfig": traffic_state["timerConfig"],
-        }
+        if (intersection_id in registry) == create:
+            if create:
+                raise HTTPException(status_code=409, detail=f"Intersection '{intersection_id}' already exists")
+            raise HTTPException(status_code=404, detail=f"Intersection '{intersection_id}' not found")
+        _publish_locked([_apply_mode_locked(intersection_id, mode, timer_cfg)], "mode")
+        print(f"🔄 Traffic mode of '{intersection_id}' changed to: {mode}")
+
+    # ✅ save fixed snapshot to file + DB (ONLY ON APPLY), write-behind
+    persistence.mark_dirty([intersection_id])
 
 @router.post("/control")
-async def control_lights(request: TrafficControlRequest):
+async def control_lights(request: TrafficControlRequest, intersection_id: str = DEFAULT_INTERSECTION):
     """
-    Apply configuration:
+    Apply configuration to one registered intersection (404 otherwise,
+    see POST /intersections):
     - AUTO: reset fixed timer (30/3/27 behavior)
     - MANUAL: apply timerConfig
     - EMERGENCY: all red
-    - AI-BASED: placeholder = AUTO fixed
-    DB: chỉ lưu snapshot cố định 4 hướng khi APPLY.
+    - AI-BASED: adaptive (Webster) từ /api/traffic-count, tính lại mỗi chu kỳ
+    DB: chỉ lưu snapshot cố định 4 hướng khi APPLY (ghi nền, trả về ngay).
     """
-    snapshot: Optional[Dict] = None
-
     try:
-        with state_lock:
-            traffic_state["mode"] = request.mode
-            print(f"🔄 Traffic mode changed to: {request.mode}")
-
-            if request.mode == "AUTO":
-                traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                _reset_cycle_locked(phase=1)
+        _get_snapshot(intersection_id)   # 404 lock-free, không tốn thread
+        timer_cfg = _timer_cfg(request.mode, request.timerConfig)
 
-            elif request.mode == "MANUAL":
-                if request.timerConfig is None:
-                    raise HTTPException(status_code=400, detail="timerConfig is required for MANUAL mode")
-                traffic_state["timerConfig"] = request.timerConfig.dict()
-                _reset_cycle_locked(phase=1)
-
-            elif request.mode == "AI-BASED":
-                traffic_state["timerConfig"] = AUTO_FIXED_TIMER.copy()
-                _reset_cycle_locked(phase=1)
-
-            elif request.mode == "EMERGENCY":
-                _set_emergency_locked()
-
-            snapshot = _snapshot_for_save_locked()
-
-        # ✅ save outside lock (avoid deadlock)
-        if snapshot is not None:
-            _save_config_snapshot_to_file(snapshot)
-
-            # ✅ save fixed snapshot to DB (ONLY ON APPLY)
-            _save_to_traffic_lights_4ways(snapshot)
+        await run_in_threadpool(_apply_control, intersection_id, request.mode, timer_cfg)
 
         return {"success": True, "message": "Configuration updated successfully"}
 
@@ -432,10 +680,22 @@ async def control_lights(request: TrafficControlRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/intersections", status_code=201, response_model=IntersectionSummary)
+async def register_intersection(
+    request: IntersectionCreate,
+    user: models.User = Depends(role_required(["admin"])),
+):
+    """Register a new intersection (admin only). 409 if the id already exists."""
+    timer_cfg = _timer_cfg(request.mode, request.timerConfig)
+    await run_in_threadpool(_apply_control, request.id, request.mode, timer_cfg, True)
+    return {"id": request.id, "mode": request.mode}
+
 @router.get("/health")
 async def health_check():
+    snap = snapshots.get(DEFAULT_INTERSECTION)
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "mode": traffic_state["mode"],
+        "mode": snap.mode if snap is not None else None,
+        "intersections": len(snapshots),
     }
@@ -2,7 +2,7 @@
 import os
 from passlib.context import CryptContext
 from jose import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import uuid
 
 # ================= Config =================
@@ -28,3 +28,16 @@ def create_access_token(subject: str, expires_minutes: int | None = None) -> dic
     payload = {"sub": subject, "iat": now, "exp": expire, "jti": jti}
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     return {"access_token": token, "jti": jti}
+
+# ================= Time =================
+def device_time(ts: datetime | None) -> datetime:
+    """Timestamp thiết bị -> UTC naive (như CURRENT_TIMESTAMP của DB); None -> bây giờ."""
+    if ts is None:
+        return datetime.utcnow()
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def epoch(ts: datetime) -> float:
+    """UTC naive -> epoch giây."""
+    return ts.replace(tzinfo=timezone.utc).timestamp()
@@ -0,0 +1,105 @@
+# bench/binary_ingest.py
+"""
+JSON vs binary_format cho /api/traffic-count/batch.
+
+- kích thước: byte mỗi bản ghi
+- decode: JSON + pydantic (TrafficCountIn) vs binary_format.decode_rows, bản ghi/giây
+- end-to-end: POST /api/traffic-count/batch qua TestClient (auth, parse, group commit)
+
+    python bench/binary_ingest.py
+    python bench/binary_ingest.py --records 10000 --rounds 20
+
+So sánh trước/sau: chạy với PYTHONPATH trỏ tới checkout cũ (git worktree).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ADMIN = ("bench@example.com", "bench")
+
+def _records(n: int):
+    """1/5 bản ghi không có intersection_id (nút mặc định), còn lại 4 nút giao."""
+    base = time.time() - n
+    return [
+        (base + i, None if i % 5 == 0 else f"i{i % 4}",
+         random.randint(0, 60), random.randint(0, 60), random.randint(0, 60), random.randint(0, 60))
+        for i in range(n)
+    ]
+
+def _json_body(records) -> bytes:
+    items = []
+    for ts, iid, n, s, e, w in records:
+        item = {"north": n, "south": s, "east": e, "west": w,
+                "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat()}
+        if iid is not None:
+            item["intersection_id"] = iid
+        items.append(item)
+    return json.dumps(items).encode()
+
+def _best_rate(fn, n: int, rounds: int) -> float:
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return n / min(times)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--label", default="current")
+    args = parser.parse_args()
+
+    # append: PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="bench_binary_"))
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    os.environ.update(ADMIN_EMAIL=ADMIN[0], ADMIN_PASS=ADMIN[1], INGEST_DURABILITY="sync")
+
+    from fastapi.testclient import TestClient
+    from app import ai_ingest, binary_format
+    from app.main import app
+
+    records = _records(args.records)
+    blob = binary_format.encode(records)
+    body = _json_body(records)
+
+    decoded = binary_format.decode_rows(blob, ai_ingest.rollups.DEFAULT_INTERSECTION)
+    parsed = ai_ingest._to_rows(ai_ingest._parse_batch(body, "application/json"))
+    assert [r["intersection_id"] for r in decoded] == [r[1] or "main" for r in records]
+    assert len(parsed) == len(decoded)
+
+    rate_bin = _best_rate(lambda: binary_format.decode_rows(blob), args.records, args.rounds)
+    rate_json = _best_rate(
+        lambda: ai_ingest._to_rows(ai_ingest._parse_batch(body, "application/json")),
+        args.records, args.rounds,
+    )
+
+    with TestClient(app) as client:
+        token = client.post("/auth/token", data={"username": ADMIN[0], "password": ADMIN[1]}).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+
+        def post(content: bytes, content_type: str) -> float:
+            t0 = time.perf_counter()
+            r = client.post("/api/traffic-count/batch", content=content,
+                            headers={**auth, "Content-Type": content_type})
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        e2e_bin = [post(blob, binary_format.CONTENT_TYPE) for _ in range(args.rounds)]
+        e2e_json = [post(body, "application/json") for _ in range(args.rounds)]
+
+    print(f"{args.label}: {args.records} records/batch, {args.rounds} rounds")
+    print(f"  size     binary {len(blob) / args.records:6.1f} B/record   json {len(body) / args.records:6.1f} B/record")
+    print(f"  decode   binary {rate_bin:10.0f} rec/s   json+pydantic {rate_json:10.0f} rec/s   x{rate_bin / rate_json:.1f}")
+    print(f"  POST     binary {statistics.median(e2e_bin) * 1000:8.1f} ms   json {statistics.median(e2e_json) * 1000:8.1f} ms   (median)")
+
+if __name__ == "__main__":
+    main()
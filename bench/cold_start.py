@@ -0,0 +1,84 @@
+# bench/cold_start.py
+"""
+Cold start: từ lúc chạy uvicorn tới khi GET / trả 200 (lifespan startup xong).
+
+Mỗi lần chạy là 1 process mới (như redeploy / scale-out trên Render/Heroku):
+- fresh DB:    thư mục trống -> tạo schema, seed, admin
+- existing DB: chạy lại trên DB của lần trước -> seed idempotent, không ghi gì thêm
+
+    python bench/cold_start.py
+    python bench/cold_start.py --runs 10 --label before   # PYTHONPATH=checkout cũ
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _start_once(workdir: str, timeout: float) -> float:
+    port = _free_port()
+    # PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    pythonpath = os.pathsep.join(p for p in (os.environ.get("PYTHONPATH"), REPO) if p)
+    env = dict(os.environ, PYTHONPATH=pythonpath,
+               ADMIN_EMAIL="bench@example.com", ADMIN_PASS="bench",
+               MQTT_BROKER=os.environ.get("MQTT_BROKER", "127.0.0.1"))
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=0.5) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - t0
+            except OSError:
+                pass
+            if time.perf_counter() - t0 > timeout:
+                raise TimeoutError("server did not come up")
+            # poll thưa: trên máy ít core, client poll dày tranh CPU với server
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--label", default="current")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_cold_")
+    try:
+        fresh = []
+        for i in range(args.runs):
+            workdir = os.path.join(root, f"fresh{i}")
+            os.makedirs(workdir)
+            fresh.append(_start_once(workdir, args.timeout))
+        # DB của lần fresh cuối làm DB "đã có"
+        existing = [_start_once(workdir, args.timeout) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for name, times in (("fresh DB", fresh), ("existing DB", existing)):
+        print(f"{args.label} {name:12} median {statistics.median(times) * 1000:6.0f} ms  "
+              f"(min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f}, {len(times)} runs)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench/event_loop_latency.py
+"""
+Độ trễ event loop khi /traffic-lights/status chịu tải đồng thời trong lúc ticker chạy.
+
+Chạy trong 1 process (ASGI, không qua mạng): N client gọi /status liên tục,
+1 probe đo asyncio.sleep(PROBE) bị trễ bao lâu (loop bị chặn bởi lock / CPU),
+ticker chuyển pha cho --intersections nút giao với chu kỳ ngắn.
+
+    python bench/event_loop_latency.py
+    python bench/event_loop_latency.py --intersections 1000 --clients 100 --seconds 20
+
+So sánh trước/sau: chạy với PYTHONPATH trỏ tới checkout cũ (git worktree).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROBE = 0.005   # giây
+
+def _setup(n: int) -> None:
+    # import app sau khi chdir: DB + traffic_config.json nằm trong thư mục tạm
+    os.chdir(tempfile.mkdtemp(prefix="bench_loop_"))
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    short = {d: {"red": 3, "green": 1} for d in ("North", "South", "East", "West")}
+    intersections = {"main": {"mode": "MANUAL", "timerConfig": short}}
+    for i in range(n - 1):
+        intersections[f"x{i}"] = {"mode": "MANUAL", "timerConfig": short}
+    with open("traffic_config.json", "w") as f:
+        json.dump({"intersections": intersections}, f)
+
+def _pct(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+async def _run(args) -> None:
+    import httpx
+    from fastapi import FastAPI
+    from app import database, traffic
+
+    database.init_db()
+    traffic.start_traffic_system()
+    app = FastAPI()
+    app.include_router(traffic.router)
+
+    stop = asyncio.Event()
+    lags, latencies = [], []
+
+    async def probe():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(PROBE)
+            lags.append(time.perf_counter() - t0 - PROBE)
+
+    async def client(http, iid):
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            r = await http.get("/traffic-lights/status", params={"intersection_id": iid})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+            # ASGITransport không có socket: nhả loop như 1 lần đọc mạng
+            await asyncio.sleep(0)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        ids = ["main"] + [f"x{i}" for i in range(args.intersections - 1)]
+        tasks = [asyncio.create_task(probe())]
+        tasks += [asyncio.create_task(client(http, ids[i % len(ids)])) for i in range(args.clients)]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    # checkout cũ có thể chưa có 2 hàm này
+    if hasattr(traffic, "stop_traffic_system"):
+        traffic.stop_traffic_system()
+    if hasattr(database, "async_engine"):
+        await database.async_engine.dispose()
+    print(f"{args.label}: {args.intersections} intersections, {args.clients} clients, {args.seconds:.0f}s")
+    print(f"  /status      {len(latencies) / args.seconds:8.0f} req/s  "
+          f"p50 {_pct(latencies, .5):.2f} ms  p99 {_pct(latencies, .99):.2f} ms")
+    print(f"  loop lag     p50 {_pct(lags, .5):.2f} ms  p99 {_pct(lags, .99):.2f} ms  "
+          f"max {max(lags) * 1000:.2f} ms  mean {statistics.mean(lags) * 1000:.2f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--intersections", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--label", default="current")
+    args = parser.parse_args()
+
+    # append: PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    _setup(args.intersections)
+    asyncio.run(_run(args))
+
+if __name__ == "__main__":
+    main()
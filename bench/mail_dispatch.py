@@ -0,0 +1,159 @@
+# bench/mail_dispatch.py
+"""
+notify.MailDispatcher vs send_mail_sync, qua 1 SMTP stand-in chạy trong process.
+
+Stand-in trả lời EHLO/AUTH PLAIN/MAIL/RCPT/DATA/QUIT, mỗi reply trễ --rtt ms
+(mô phỏng round-trip tới SMTP thật; localhost che mất chi phí kết nối). Đo:
+- send_mail_sync: mail/giây, = độ trễ mỗi request khi gửi inline như trước
+- enqueue(): độ trễ phía handler (µs/mail)
+- dispatcher: mail/giây với SMTP_POOL_SIZE kết nối giữ mở
+- digest: --alerts cảnh báo cho --recipients người nhận -> số mail thực gửi
+- POST /auth/register/send-code: median latency của handler (gồm hash mật khẩu)
+
+    python bench/mail_dispatch.py
+    python bench/mail_dispatch.py --mails 2000 --rtt 20 --workers 4
+"""
+import argparse
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# ============================================
+# SMTP STAND-IN
+# ============================================
+
+class _Smtp(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rtt: float):
+        super().__init__(("127.0.0.1", 0), _SmtpSession)
+        self.rtt = rtt
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.connections = 0
+
+class _SmtpSession(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        if self.server.rtt:
+            time.sleep(self.server.rtt)
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 bench ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line[:4].upper()
+            if cmd == b"EHLO":
+                self.reply("250-bench\r\n250-AUTH PLAIN\r\n250 OK")
+            elif cmd == b"AUTH":
+                self.reply("235 OK")
+            elif cmd == b"DATA":
+                self.reply("354 go")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.delivered += 1
+                self.reply("250 queued")
+            elif cmd == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:   # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+# ============================================
+# BENCH
+# ============================================
+
+def _wait(predicate, timeout: float = 300) -> float:
+    t0 = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError("bench timed out")
+        time.sleep(0.002)
+    return time.perf_counter()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mails", type=int, default=500)
+    parser.add_argument("--sync-mails", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=5, help="ms mỗi reply SMTP")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--recipients", type=int, default=5)
+    parser.add_argument("--label", default="current")
+    args = parser.parse_args()
+
+    smtp = _Smtp(args.rtt / 1000)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+
+    # append: PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="bench_mail_"))
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    os.environ.update(SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp.server_address[1]),
+                      SMTP_USER="bench@example.com", SMTP_PASS="x", SMTP_STARTTLS="0",
+                      SMTP_POOL_SIZE=str(args.workers))
+
+    from app import notify
+
+    print(f"{args.label}: rtt {args.rtt:.0f} ms/reply, {args.workers} SMTP connection(s)")
+
+    # send_mail_sync: kết nối + login mỗi mail (đường cũ, chạy trong request)
+    t0 = time.perf_counter()
+    for i in range(args.sync_mails):
+        notify.send_mail_sync([f"s{i}@example.com"], "bench", "body")
+    sync_rate = args.sync_mails / (time.perf_counter() - t0)
+    print(f"  send_mail_sync  {sync_rate:8.1f} mail/s   ({1000 / sync_rate:.1f} ms inline per mail)")
+
+    # dispatcher: handler chỉ enqueue
+    d = notify.MailDispatcher(workers=args.workers, digest_seconds=0.2)
+    d.start()
+    base = smtp.delivered
+    t0 = time.perf_counter()
+    for i in range(args.mails):
+        d.enqueue(f"u{i}@example.com", "bench", "body")
+    enqueue_s = time.perf_counter() - t0
+    done = _wait(lambda: smtp.delivered - base >= args.mails)
+    print(f"  enqueue         {enqueue_s / args.mails * 1e6:8.1f} µs/mail (handler side)")
+    print(f"  dispatcher      {args.mails / (done - t0):8.1f} mail/s")
+
+    # digest: mọi cảnh báo trong cửa sổ -> 1 mail mỗi người nhận, dòng trùng bỏ
+    base = smtp.delivered
+    to = [f"p{i}@example.com" for i in range(args.recipients)]
+    for i in range(args.alerts):
+        d.enqueue_alert(to, "Traffic alert", f"intersection i{i % 10}: congestion")
+    _wait(lambda: smtp.delivered - base >= args.recipients)
+    time.sleep(0.5)
+    print(f"  digest          {args.alerts} alerts x {args.recipients} recipients -> "
+          f"{smtp.delivered - base} mail(s)")
+    d.stop()
+
+    # handler thật: send-code (hash mật khẩu + ghi DB + enqueue)
+    from fastapi.testclient import TestClient
+    from app.main import app
+    latencies = []
+    with TestClient(app) as client:
+        for i in range(20):
+            t0 = time.perf_counter()
+            r = client.post("/auth/register/send-code", json={
+                "email": f"r{i}@example.com", "password": "pw", "retype_password": "pw",
+                "firstname": "a", "lastname": "b",
+            })
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+    print(f"  send-code       {statistics.median(latencies) * 1000:8.1f} ms median handler latency")
+    print(f"  SMTP connections opened: {smtp.connections}")
+
+if __name__ == "__main__":
+    main()
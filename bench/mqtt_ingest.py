@@ -0,0 +1,201 @@
+# bench/mqtt_ingest.py
+"""
+MQTT ingest (ai_ingest.MqttCountIngest): message/giây duy trì, qua broker thật.
+
+Broker là 1 stand-in MQTT 3.1.1 tối giản chạy trong process (CONNECT, SUBSCRIBE,
+PUBLISH QoS 0/1, PING): client paho của app subscribe TOPIC_TRAFFIC_COUNT như
+production, 1 client paho khác publish --messages message. Đo:
+- received: tới khi MqttCountIngest đã decode + validate hết
+- persisted: tới khi mọi hàng đã commit vào traffic_count (group commit)
+
+    python bench/mqtt_ingest.py
+    python bench/mqtt_ingest.py --messages 50000 --per-message 10 --format binary
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+TOPIC = "bench/traffic/count"
+
+# ============================================
+# BROKER STAND-IN
+# ============================================
+
+def _remaining_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        n, digit = divmod(n, 128)
+        out.append(digit | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def _packet(first: int, body: bytes) -> bytes:
+    return bytes([first]) + _remaining_length(len(body)) + body
+
+class _Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Session)
+        self.lock = threading.Lock()
+        self.subscribers = {}   # topic -> {session}
+        self.subscribed = threading.Event()
+
+    def route(self, topic: str, payload: bytes) -> None:
+        raw = topic.encode()
+        packet = _packet(0x30, struct.pack("!H", len(raw)) + raw + payload)
+        for session in list(self.subscribers.get(topic, ())):
+            session.send(packet)
+
+class _Session(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.request.makefile("rb")
+        self.wlock = threading.Lock()
+
+    def send(self, data: bytes) -> None:
+        with self.wlock:
+            self.request.sendall(data)
+
+    def _read_packet(self):
+        head = self.rfile.read(1)
+        if not head:
+            return None, b""
+        length, shift = 0, 0
+        while True:
+            b = self.rfile.read(1)[0]
+            length |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        return head[0], self.rfile.read(length)
+
+    def handle(self):
+        broker = self.server
+        try:
+            while True:
+                first, body = self._read_packet()
+                if first is None:
+                    return
+                kind = first >> 4
+                if kind == 1:        # CONNECT
+                    self.send(b"\x20\x02\x00\x00")
+                elif kind == 3:      # PUBLISH
+                    qos = (first >> 1) & 3
+                    n = struct.unpack_from("!H", body)[0]
+                    topic = body[2:2 + n].decode()
+                    pos = 2 + n
+                    if qos:
+                        self.send(b"\x40\x02" + body[pos:pos + 2])   # PUBACK
+                        pos += 2
+                    broker.route(topic, body[pos:])
+                elif kind == 8:      # SUBSCRIBE
+                    pid, pos, granted = body[:2], 2, b""
+                    while pos < len(body):
+                        n = struct.unpack_from("!H", body, pos)[0]
+                        topic = body[pos + 2:pos + 2 + n].decode()
+                        pos += 3 + n
+                        with broker.lock:
+                            broker.subscribers.setdefault(topic, set()).add(self)
+                        granted += b"\x00"
+                    self.send(_packet(0x90, pid + granted))
+                    broker.subscribed.set()
+                elif kind == 12:     # PINGREQ
+                    self.send(b"\xd0\x00")
+                elif kind == 14:     # DISCONNECT
+                    return
+        finally:
+            with broker.lock:
+                for subs in broker.subscribers.values():
+                    subs.discard(self)
+
+# ============================================
+# BENCH
+# ============================================
+
+def _payloads(n: int, per_message: int, fmt: str):
+    from app import binary_format
+    out = []
+    for i in range(n):
+        iid = f"i{i % 4}"
+        if fmt == "binary":
+            out.append(binary_format.encode([(0, iid, i % 50, 1, 2, 3)] * per_message))
+            continue
+        item = {"north": i % 50, "south": 1, "east": 2, "west": 3, "intersection_id": iid}
+        out.append(json.dumps(item if per_message == 1 else [item] * per_message).encode())
+    return out
+
+def _wait(predicate, timeout: float) -> float:
+    t0 = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError("bench timed out")
+        time.sleep(0.005)
+    return time.perf_counter()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--per-message", type=int, default=1, help="bản ghi mỗi message")
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--label", default="current")
+    args = parser.parse_args()
+
+    broker = _Broker()
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+
+    # append: PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="bench_mqtt_"))
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    os.environ.update(MQTT_BROKER="127.0.0.1", MQTT_PORT=str(broker.server_address[1]),
+                      TOPIC_TRAFFIC_COUNT=TOPIC)
+
+    import paho.mqtt.client as mqtt
+    from sqlalchemy import func, select
+    from app import ai_ingest, database, ingest_buffer, models, mqtt_client
+
+    database.init_db()
+    ingest_buffer.buffer.start()
+    ai_ingest.mqtt_counts.start(TOPIC)
+    if not broker.subscribed.wait(10):
+        raise SystemExit("app never subscribed to the stand-in broker")
+
+    payloads = _payloads(args.messages, args.per_message, args.format)
+    publisher = mqtt.Client()
+    publisher.connect("127.0.0.1", broker.server_address[1])
+    publisher.loop_start()
+
+    counts = ai_ingest.mqtt_counts
+    t0 = time.perf_counter()
+    for p in payloads:
+        publisher.publish(TOPIC, p)
+    t_received = _wait(lambda: counts.received + counts.rejected >= args.messages, 120)
+
+    expected = args.messages * args.per_message
+    def persisted() -> bool:
+        with database.SessionLocal() as db:
+            return db.scalar(select(func.count(models.TrafficCount.id))) >= expected
+    t_persisted = _wait(persisted, 120)
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    counts.stop()
+    ingest_buffer.buffer.stop()
+    mqtt_client.stop()
+    broker.shutdown()
+
+    print(f"{args.label}: {args.messages} messages x {args.per_message} record(s), {args.format}")
+    print(f"  received   {args.messages / (t_received - t0):10.0f} msg/s   rejected {counts.rejected}")
+    print(f"  persisted  {expected / (t_persisted - t0):10.0f} rows/s  ({t_persisted - t0:.2f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench/sqlite_rw.py
+"""
+Đọc/ghi SQLite đồng thời: profile mặc định của SQLite vs SQLITE_PRAGMAS (database.py).
+
+--writers thread ghi lô nhỏ vào traffic_count (như ingest / ticker), --readers
+thread đọc như dashboard (100 hàng mới nhất + COUNT theo timestamp).
+- default: journal DELETE, synchronous FULL, không mmap, cache 2 MB (trước khi tune)
+- tuned:   giá trị hiện tại của database.SQLITE_PRAGMAS (WAL, NORMAL, mmap, 64 MB)
+
+    python bench/sqlite_rw.py --profile default
+    python bench/sqlite_rw.py --profile tuned
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_PROFILE = {
+    "SQLITE_JOURNAL_MODE": "DELETE",
+    "SQLITE_SYNCHRONOUS": "FULL",
+    "SQLITE_MMAP_SIZE": "0",
+    "SQLITE_CACHE_SIZE": "-2000",
+}
+
+def _pct(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profile", choices=["default", "tuned"], default="tuned")
+    parser.add_argument("--rows", type=int, default=50000, help="hàng có sẵn trước khi đo")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--batch", type=int, default=20, help="hàng mỗi transaction ghi")
+    parser.add_argument("--seconds", type=float, default=8)
+    args = parser.parse_args()
+
+    # append: PYTHONPATH (checkout khác) được ưu tiên hơn repo hiện tại
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp(prefix="bench_sqlite_"))
+    os.environ["DATABASE_URL"] = "sqlite:///./bench.db"
+    if args.profile == "default":
+        os.environ.update(DEFAULT_PROFILE)
+
+    from sqlalchemy import func, insert, select
+    from app import database, models
+
+    database.init_db()
+    tc = models.TrafficCount
+    row = {"timestamp": datetime.utcnow(), "north": 1, "south": 2, "east": 3, "west": 4}
+    with database.engine.begin() as conn:
+        conn.execute(insert(tc), [row] * args.rows)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"writes": 0, "reads": 0, "errors": 0}
+    write_lat, read_lat = [], []
+
+    def writer():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with database.engine.begin() as conn:
+                    conn.execute(insert(tc), [dict(row, timestamp=datetime.utcnow())] * args.batch)
+            except Exception:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["writes"] += 1
+                write_lat.append(time.perf_counter() - t0)
+
+    def reader():
+        since = datetime(2000, 1, 1)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with database.SessionLocal() as db:
+                    db.execute(select(tc).order_by(tc.id.desc()).limit(100)).all()
+                    db.execute(select(func.count()).select_from(tc).where(tc.timestamp >= since)).scalar()
+            except Exception:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["reads"] += 1
+                read_lat.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    with database.engine.connect() as conn:
+        journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    print(f"{args.profile} (journal_mode={journal}): {args.writers} writers x {args.batch} rows, "
+          f"{args.readers} readers, {args.seconds:.0f}s")
+    print(f"  writes  {stats['writes'] / args.seconds:8.0f} tx/s   p99 {_pct(write_lat, .99):7.1f} ms   "
+          f"max {_pct(write_lat, 1):7.1f} ms")
+    print(f"  reads   {stats['reads'] / args.seconds:8.0f} /s     p99 {_pct(read_lat, .99):7.1f} ms")
+    print(f"  errors  {stats['errors']}")
+
+if __name__ == "__main__":
+    main()